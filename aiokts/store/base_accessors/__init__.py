@@ -74,6 +74,19 @@ class BaseAccessor(object):
     def wait_connected(self):
         return self._connected_event.wait()
 
+    async def load_entity(self, model_cls, id, loader, ctx=None):
+        """
+            Loads an entity with `await loader(id)` through the identity
+            map of the request Context (if ctx is passed).
+            Raises model_cls.DoesNotExist if there is no such entity
+        """
+        if ctx is not None:
+            return await ctx.load_entity(model_cls, id, loader)
+        entity = await loader(id)
+        if entity is None:
+            raise model_cls.DoesNotExist(id)
+        return entity
+
     @property
     def fingerprint(self):
         return '[{}://{}:{}]'.format(self.type, self.host, self.port)
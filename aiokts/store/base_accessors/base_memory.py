@@ -0,0 +1,101 @@
+import asyncio
+import sys
+
+from aiokts.store.base_accessors import BaseAccessor
+from aiokts.util.lru import LRUCache
+
+_sentinel = object()
+
+
+class BaseMemoryAccessor(BaseAccessor):
+    """
+        In-process key-value storage with LRU eviction and per-key TTL.
+        Can be listed in STORE_NEED like any other accessor.
+
+        Config (all keys are optional):
+            max_items: 10000
+            max_size: 67108864  # bytes
+            default_ttl: 60.0   # seconds
+    """
+    DEFAULT_MAX_ITEMS = 10000
+    DEFAULT_MAX_SIZE = None
+    DEFAULT_TTL = None
+
+    def __init__(self, config, type, store, loop=None):
+        super().__init__(config, type, store, loop=loop)
+        self._cache = self.make_cache()
+        self._pending = {}
+
+    def check_config(self):
+        if self.config is None:
+            self.config = {}
+        super().check_config()
+
+    def make_cache(self):
+        return LRUCache(
+            max_items=self.config.get('max_items', self.DEFAULT_MAX_ITEMS),
+            max_size=self.config.get('max_size', self.DEFAULT_MAX_SIZE),
+            default_ttl=self.config.get('default_ttl', self.DEFAULT_TTL),
+            sizeof=self.sizeof
+        )
+
+    def sizeof(self, value):
+        return sys.getsizeof(value)
+
+    @property
+    def fingerprint(self):
+        return '[{}://memory]'.format(self.type)
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def stats(self):
+        return self._cache.stats()
+
+    async def _connect(self):
+        pass
+
+    async def _disconnect(self):
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        self._cache.clear()
+
+    def get(self, key, default=None):
+        return self._cache.get(key, default)
+
+    def set(self, key, value, ttl=None):
+        return self._cache.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        return self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    async def get_or_set(self, key, coro_factory, ttl=None):
+        """
+            Returns cached value for key or awaits coro_factory() and caches
+            its result. Concurrent callers for the same missing key share
+            a single coro_factory() call (stampede protection)
+        """
+        value = self._cache.get(key, _sentinel)
+        if value is not _sentinel:
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_factory(), loop=self.loop)
+            self._pending[key] = task
+
+            def on_done(f):
+                if self._pending.get(key) is f:
+                    del self._pending[key]
+                if not f.cancelled() and f.exception() is None:
+                    self._cache.set(key, f.result(), ttl=ttl)
+
+            task.add_done_callback(on_done)
+
+        # shield - cancelling one of the waiters must not cancel the others
+        return await asyncio.shield(task, loop=self.loop)
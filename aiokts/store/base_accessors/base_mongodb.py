@@ -4,6 +4,7 @@ import motor.motor_asyncio
 from pymongo.errors import AutoReconnect, ConnectionFailure
 
 from aiokts.store.base_accessors import BaseAccessor, ConfigurationError
+from aiokts.util import tracing
 
 
 class BaseMongoDbAccessor(BaseAccessor):
@@ -36,6 +37,14 @@ class BaseMongoDbAccessor(BaseAccessor):
     def db(self):
         return self._conn[self.db_name] if self._conn is not None else None
 
+    async def command(self, command, ctx=None, **kwargs):
+        span = tracing.span(ctx, 'mongodb.command')
+        with span:
+            if span.recording:
+                span.set_attribute('db.system', 'mongodb')
+                span.set_attribute('db.instance', self.fingerprint)
+            return await self.db.command(command, **kwargs)
+
     async def ping(self):
         try:
             await self._conn.admin.command({'ping': 1})
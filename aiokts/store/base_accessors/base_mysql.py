@@ -289,6 +289,31 @@ class BaseMySQLAccessor(BaseAccessor):
         res = await self.execute(query, *multiparams, **params)
         return await res.first()
 
+    async def fetch_entity(self, model_cls, table, id, pk='id', ctx=None):
+        """
+            Fetches a row of table by primary key as model_cls instance.
+            With ctx the entity is taken from the request identity map
+            if it was already loaded (or found absent) in this request
+        """
+        async def loader(id):
+            row = await self.fetch_first(
+                table.select().where(table.c[pk] == id), ctx=ctx)
+            return model_cls.from_rows([row])[0] if row is not None else None
+
+        return await self.load_entity(model_cls, id, loader, ctx=ctx)
+
+    async def update_changed(self, table, model, pk='id', **params):
+        """
+            UPDATE of only the changed fields of model (with TRACK_CHANGES).
+            Does nothing if there are no changes
+        """
+        q = model.build_update_query(table, pk=pk)
+        if q is None:
+            return None
+        res = await self.execute(q, **params)
+        model.mark_clean()
+        return res
+
     @staticmethod
     def dump_sql(func, bind=False):
         @functools.wraps(func)
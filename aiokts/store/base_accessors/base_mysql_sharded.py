@@ -0,0 +1,152 @@
+import asyncio
+import bisect
+import zlib
+
+from aiokts.store.base_accessors import BaseAccessor, ConfigurationError
+from aiokts.store.base_accessors.base_mysql import BaseMySQLAccessor
+
+
+class ShardedMySQLAccessor(BaseAccessor):
+    """
+        Holds one BaseMySQLAccessor (engine) per shard and routes queries
+        by shard key.
+
+        Config:
+            username: ...
+            password: ...
+            db: ...
+            pool_size: 10
+            sharding: hash  # or range
+            ranges: [1000000, 2000000]  # for range: upper bounds (exclusive)
+            shards:
+              - host: 10.0.0.1
+              - host: 10.0.0.2
+                port: 3307
+              - host: 10.0.0.3
+
+        Every shard config is merged on top of the common keys.
+        Shard resolution can be replaced by assigning any callable
+        (shard_key, shards_count) -> shard index to shard_func
+    """
+    SHARD_ACCESSOR_CLS = BaseMySQLAccessor
+    SHARDING_KEYS = ('shards', 'sharding', 'ranges')
+
+    def __init__(self, config, type, store, loop=None):
+        super().__init__(config, type, store, loop=loop)
+        self.shards = [
+            self.SHARD_ACCESSOR_CLS(config=shard_config,
+                                    type='{}[{}]'.format(self.type, i),
+                                    store=store,
+                                    loop=self.loop)
+            for i, shard_config in enumerate(self._shards_config())
+        ]
+
+        sharding = self.config.get('sharding', 'hash')
+        if sharding == 'range':
+            self.ranges = list(self.config['ranges'])
+            self.shard_func = self.range_shard
+        else:
+            self.ranges = None
+            self.shard_func = self.hash_shard
+
+    def check_config(self):
+        super().check_config()
+        shards = self.config.get('shards')
+        if not isinstance(shards, list) or len(shards) == 0:
+            raise ConfigurationError(
+                'shards must be a non-empty list for {}'.format(
+                    self.__class__.__name__))
+
+        sharding = self.config.get('sharding', 'hash')
+        if sharding not in ('hash', 'range'):
+            raise ConfigurationError(
+                'Unknown sharding `{}`. Expected hash or range'.format(
+                    sharding))
+        if sharding == 'range':
+            ranges = self.config.get('ranges')
+            if not isinstance(ranges, list) \
+                    or len(ranges) != len(shards) - 1 \
+                    or ranges != sorted(ranges):
+                raise ConfigurationError(
+                    'ranges must be a sorted list of {} upper bounds'.format(
+                        len(shards) - 1))
+
+    def _shards_config(self):
+        common = {k: v for k, v in self.config.items()
+                  if k not in self.SHARDING_KEYS}
+        for shard in self.config['shards']:
+            shard_config = dict(common)
+            shard_config.update(shard)
+            yield shard_config
+
+    @property
+    def fingerprint(self):
+        return '[{}://{} shards]'.format(self.type, len(self.config['shards']))
+
+    @staticmethod
+    def hash_shard(shard_key, shards_count):
+        if isinstance(shard_key, int):
+            return shard_key % shards_count
+        if isinstance(shard_key, str):
+            shard_key = shard_key.encode('utf-8')
+        return zlib.crc32(shard_key) % shards_count
+
+    def range_shard(self, shard_key, shards_count):
+        return bisect.bisect_right(self.ranges, shard_key)
+
+    def shard_index(self, shard_key):
+        if shard_key is None:
+            raise ValueError('shard_key is required')
+        return self.shard_func(shard_key, len(self.shards))
+
+    def shard(self, shard_key):
+        return self.shards[self.shard_index(shard_key)]
+
+    async def _connect(self):
+        await asyncio.gather(*[s.connect() for s in self.shards],
+                             loop=self.loop)
+
+    async def _disconnect(self):
+        await asyncio.gather(*[s.disconnect() for s in self.shards],
+                             loop=self.loop)
+
+    async def ping(self):
+        pings = await asyncio.gather(*[s.ping() for s in self.shards],
+                                     loop=self.loop)
+        return all(pings)
+
+    def acquire(self, shard_key):
+        return self.shard(shard_key).acquire()
+
+    async def execute(self, query, *multiparams, shard_key=None, **params):
+        return await self.shard(shard_key).execute(query, *multiparams,
+                                                   **params)
+
+    async def execute_trx(self, query, *multiparams, shard_key=None,
+                          **params):
+        return await self.shard(shard_key).execute_trx(query, *multiparams,
+                                                       **params)
+
+    async def fetch_all(self, query, *multiparams, shard_key=None, **params):
+        return await self.shard(shard_key).fetch_all(query, *multiparams,
+                                                     **params)
+
+    async def fetch_first(self, query, *multiparams, shard_key=None,
+                          **params):
+        return await self.shard(shard_key).fetch_first(query, *multiparams,
+                                                       **params)
+
+    async def fetch_all_shards(self, query, *multiparams, **params):
+        """
+            Runs query on all shards concurrently and returns
+            the concatenation of results (in shard order)
+        """
+        results = await asyncio.gather(
+            *[s.fetch_all(query, *multiparams, **params)
+              for s in self.shards],
+            loop=self.loop
+        )
+        merged = []
+        for rows in results:
+            merged.extend(rows)
+        return merged
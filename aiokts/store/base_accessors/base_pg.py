@@ -1,6 +1,9 @@
+import time
+
 import asyncpg
 import asyncpgsa
 from aiokts.store.base_accessors import BaseAccessor
+from aiokts.util import tracing
 
 
 class BasePgAccessor(BaseAccessor):
@@ -41,11 +44,20 @@ class BasePgAccessor(BaseAccessor):
     async def _execute_operation(self, operation, query, conn=None,
                                  *args, **kwargs):
         q, q_args = self.compile_q(query)
-        if conn:
-            return await getattr(conn, operation)(str(q), *q_args)
-        else:
-            async with self._pool.acquire() as conn:
+        span = tracing.span(kwargs.get('ctx'), 'pg.{}'.format(operation))
+        with span:
+            if span.recording:
+                span.set_attribute('db.system', 'postgresql')
+                span.set_attribute('db.instance', self.fingerprint)
+            if conn:
                 return await getattr(conn, operation)(str(q), *q_args)
+            else:
+                started = time.perf_counter()
+                async with self._pool.acquire() as conn:
+                    span.set_attribute(
+                        'db.conn_wait_ms',
+                        (time.perf_counter() - started) * 1000.0)
+                    return await getattr(conn, operation)(str(q), *q_args)
 
     async def execute(self, q, conn=None, *args, **kwargs):
         return await self._execute_operation("execute", q, conn,
@@ -62,6 +74,33 @@ class BasePgAccessor(BaseAccessor):
         return await self._execute_operation("fetch", q, conn,
                                              *args, **kwargs)
 
+    async def fetch_entity(self, model_cls, table, id, pk='id', conn=None,
+                           ctx=None):
+        """
+            Fetches a row of table by primary key as model_cls instance.
+            With ctx the entity is taken from the request identity map
+            if it was already loaded (or found absent) in this request
+        """
+        async def loader(id):
+            row = await self.fetchrow(
+                table.select().where(table.c[pk] == id), conn, ctx=ctx)
+            return model_cls.from_rows([row])[0] if row is not None else None
+
+        return await self.load_entity(model_cls, id, loader, ctx=ctx)
+
+    async def update_changed(self, table, model, pk='id', conn=None,
+                             *args, **kwargs):
+        """
+            UPDATE of only the changed fields of model (with TRACK_CHANGES).
+            Does nothing if there are no changes
+        """
+        q = model.build_update_query(table, pk=pk)
+        if q is None:
+            return None
+        res = await self.execute(q, conn, *args, **kwargs)
+        model.mark_clean()
+        return res
+
     @staticmethod
     def transaction(conn, **kwargs):
         return conn.transaction(**kwargs)
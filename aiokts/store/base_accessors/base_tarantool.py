@@ -3,6 +3,7 @@ import asyncio
 import asynctnt
 
 from aiokts.store.base_accessors import BaseAccessor
+from aiokts.util import tracing
 
 
 class BaseTarantoolAccessor(BaseAccessor):
@@ -28,3 +29,12 @@ class BaseTarantoolAccessor(BaseAccessor):
     @property
     def conn(self):
         return self._conn
+
+    async def call(self, func_name, args=None, ctx=None, **kwargs):
+        span = tracing.span(ctx, 'tarantool.call')
+        with span:
+            if span.recording:
+                span.set_attribute('db.system', 'tarantool')
+                span.set_attribute('db.instance', self.fingerprint)
+                span.set_attribute('db.operation', func_name)
+            return await self._conn.call(func_name, args, **kwargs)
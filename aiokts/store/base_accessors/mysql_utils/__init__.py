@@ -1,10 +1,12 @@
 import asyncio
 import enum
 import functools
+import time
 
 import pymysql
 
 from aiokts.store.base_accessors import BaseAccessorException
+from aiokts.util import tracing
 
 
 class MySQLAccessorException(BaseAccessorException):
@@ -127,9 +129,16 @@ def mysql_connected_check(f):
 
 
 def supply_mysql_conn(method):
+    """
+        Supplies conn kwarg to the method acquiring it from the pool.
+        If ctx kwarg (request Context) is passed, connection is taken
+        from the ctx instead, so all queries of one request reuse a single
+        connection which is released by the ctx at the end of the request
+    """
     @functools.wraps(method)
     async def wrap(self, *args, **kwargs):
         conn = kwargs.get('conn')
+        ctx = kwargs.pop('ctx', None)
         self_conn = conn is None
 
         if hasattr(self, 'persist'):
@@ -139,19 +148,38 @@ def supply_mysql_conn(method):
         else:
             raise AttributeError('No connector found')
 
+        span = tracing.span(ctx, 'mysql.{}'.format(method.__name__))
         try:
-            if self_conn:
-                conn = await connector.get_conn(mode=Mode.any)
-                kwargs['conn'] = conn
-            try:
-                if asyncio.iscoroutinefunction(method):
-                    return await method(self, *args, **kwargs)
-                else:
-                    return await asyncio.coroutine(method)(
-                        self, *args, **kwargs)
-            finally:
+            with span:
+                if span.recording:
+                    span.set_attribute('db.system', 'mysql')
+                    span.set_attribute('db.instance', connector.fingerprint)
                 if self_conn:
-                    connector.release(conn)
+                    started = time.perf_counter()
+                    if ctx is not None:
+                        conn = await ctx.acquire_conn(connector,
+                                                      mode=Mode.any)
+                    else:
+                        conn = await connector.get_conn(mode=Mode.any)
+                    span.set_attribute(
+                        'db.conn_wait_ms',
+                        (time.perf_counter() - started) * 1000.0)
+                    kwargs['conn'] = conn
+                failed = True
+                try:
+                    if asyncio.iscoroutinefunction(method):
+                        res = await method(self, *args, **kwargs)
+                    else:
+                        res = await asyncio.coroutine(method)(
+                            self, *args, **kwargs)
+                    failed = False
+                    return res
+                finally:
+                    if self_conn:
+                        if ctx is not None:
+                            ctx.release_conn(connector, conn, discard=failed)
+                        else:
+                            connector.release(conn)
         except pymysql.err.OperationalError as e:
             self.logger.error('%s Cannot connect to MySQL: %s',
                               connector.fingerprint, str(e))
@@ -3,16 +3,22 @@ import collections
 import logging
 
 import datetime
+import zlib
 
-from aiokts.util.json_utils import JsonSerializable
+from aiokts.store.models import compiler
+from aiokts.store.models.lazy import LazyFieldDescriptor, storage_name
+from aiokts.util.json_utils import (JsonSerializable, datetime_to_json,
+                                    json_dumps, json_dumps_bytes)
+from aiokts.util.msgpack_utils import msgpack_typed_dumps, msgpack_typed_loads
 
 
 class Field:
-    def __init__(self, default, private):
+    def __init__(self, default, private, lazy=False):
         self.name = None
         self.model = None
         self.default = default
         self.private = private
+        self.lazy = lazy
 
     def transform_in(self, value):
         return value
@@ -20,9 +26,43 @@ class Field:
     def transform_to_json(self, value):
         return value
 
+    def to_binary(self, value):
+        return value
+
+    def from_binary(self, value):
+        return value
+
+    def to_db(self, value):
+        """
+            Value for the DB column (inverse of transform_in)
+        """
+        return value
+
+    def schema_signature(self):
+        return self.__class__.__name__
+
     def __call__(self, value):
         return self.transform_in(value)
 
+    def overrides(self, method_name):
+        return getattr(self.__class__, method_name) \
+            is not getattr(Field, method_name)
+
+    def decode(self, instance, value):
+        """
+            transform_in + model's transform_<name> for lazy fields
+        """
+        try:
+            value = self.transform_in(value)
+        except Exception as e:
+            raise Exception(compiler.TRANSFORM_ERROR.format(
+                str(e), self.name, instance.__class__))
+        transformer = getattr(instance, 'transform_{}'.format(self.name),
+                              None)
+        if transformer is not None and callable(transformer):
+            value = transformer(value)
+        return value
+
 
 class StringField(Field):
     def __init__(self, default=None, private=False):
@@ -57,9 +97,16 @@ class UnixTimestampField(Field):
         super().__init__(default, private)
 
     def transform_in(self, value):
+        if isinstance(value, datetime.datetime):
+            return value
         value = int(value)
         return datetime.datetime.fromtimestamp(value)
 
+    def to_db(self, value):
+        if isinstance(value, datetime.date):
+            return datetime_to_json(value)
+        return value
+
 
 class IntEnumField(Field):
     def __init__(self, enum_cls, default=None, private=False, json_name=False):
@@ -75,10 +122,23 @@ class IntEnumField(Field):
             return value.name
         return value.value
 
+    def to_binary(self, value):
+        return value.value
+
+    def from_binary(self, value):
+        return self.enum_cls(value)
+
+    def to_db(self, value):
+        return self.enum_cls(value).value
+
+    def schema_signature(self):
+        return '{}({})'.format(self.__class__.__name__,
+                               self.enum_cls.__name__)
+
 
 class DictField(Field):
-    def __init__(self, default=None, private=False):
-        super().__init__(default, private)
+    def __init__(self, default=None, private=False, lazy=False):
+        super().__init__(default, private, lazy)
 
     def transform_in(self, value):
         assert isinstance(value, dict), \
@@ -87,18 +147,44 @@ class DictField(Field):
             )
         return value
 
+    def to_db(self, value):
+        return json_dumps(value)
+
 
 class ForeignModelField(Field):
-    def __init__(self, model_cls, default=None, private=False):
-        super().__init__(default, private)
+    def __init__(self, model_cls, default=None, private=False, lazy=False):
+        super().__init__(default, private, lazy)
         self.model_cls = model_cls
 
     def transform_in(self, value):
+        if isinstance(value, self.model_cls):
+            return value
         return self.model_cls.parse(value)
 
     def transform_to_json(self, value):
         return value.__to_json__()
 
+    def to_binary(self, value):
+        return value._to_binary_values()
+
+    def from_binary(self, value):
+        return self.model_cls._from_binary_values(value)
+
+    def to_db(self, value):
+        return json_dumps(value)
+
+    def schema_signature(self):
+        return '{}({})'.format(self.__class__.__name__,
+                               self.model_cls.schema_hash())
+
+
+def _model_json_row(model):
+    return model.__class__._json_row()(model)
+
+
+class SchemaMismatchError(ValueError):
+    pass
+
 
 class DoesNotExistBase(Exception):
     MODEL_CLS = None
@@ -116,6 +202,17 @@ class DoesNotExistBase(Exception):
         return self.message
 
 
+def _tracking_setattr(self, name, value):
+    """
+        __setattr__ of models with TRACK_CHANGES: records assigned fields
+        (_changed is None while the instance is being constructed)
+    """
+    object.__setattr__(self, name, value)
+    changed = self._changed
+    if changed is not None and name in self._fields:
+        changed.add(name)
+
+
 class ModelMetaclass(type):
     @classmethod
     def __prepare__(mcs, name, bases):
@@ -128,11 +225,30 @@ class ModelMetaclass(type):
                 if not name.startswith('__') \
                         and isinstance(value, Field):
                     fields[name] = value
-            for name in fields:
-                del class_dict[name]
+            for name, field in fields.items():
+                if field.lazy:
+                    # decoded on first access, see LazyFieldDescriptor
+                    class_dict[name] = LazyFieldDescriptor(field, name)
+                else:
+                    del class_dict[name]
 
             class_dict['_fields'] = fields
 
+            track_changes = class_dict.get(
+                'TRACK_CHANGES',
+                any(getattr(b, 'TRACK_CHANGES', False) for b in bases))
+            if track_changes and '__setattr__' not in class_dict:
+                class_dict['__setattr__'] = _tracking_setattr
+
+            slots = class_dict.get(
+                'SLOTS', any(getattr(b, 'SLOTS', False) for b in bases))
+            if slots and '__slots__' not in class_dict:
+                class_dict['__slots__'] = tuple(
+                    storage_name(name) if field.lazy else name
+                    for name, field in fields.items())
+                if track_changes:
+                    class_dict['__slots__'] += ('_changed',)
+
         return super().__new__(mcs, class_name, bases, class_dict)
 
     def __init__(cls, class_name, bases, class_dict):
@@ -146,13 +262,36 @@ class ModelMetaclass(type):
                 f.model = cls
         super().__init__(class_name, bases, class_dict)
 
+        if fields is not None and cls.COMPILED:
+            if compiler.is_compilable(cls, '__init__', Model.__init__):
+                cls.__init__ = compiler.compile_init(cls, Model.__init__)
+            if compiler.is_compilable(cls, '__to_json__', Model.__to_json__):
+                cls.__to_json__ = compiler.compile_to_json(cls)
+
 
 class Model(JsonSerializable, metaclass=ModelMetaclass):
+    __slots__ = ()
+
     _fields = None
     DoesNotExist = None
     LOGGER = logging.getLogger('aiokts.models')
 
+    # generate specialized methods for subclasses at class creation time
+    COMPILED = True
+
+    # store fields in __slots__ instead of instance __dict__
+    SLOTS = False
+
+    # max number of distinct column layouts cached by from_rows
+    ROW_BUILDERS_CACHE_SIZE = 64
+
+    # record fields assigned after construction, see changed_fields()
+    TRACK_CHANGES = False
+    _changed = None
+
     def __init__(self, *args, **kwargs):
+        if self.TRACK_CHANGES:
+            self._changed = None
         i = 0
 
         used_kwargs = set()
@@ -183,6 +322,9 @@ class Model(JsonSerializable, metaclass=ModelMetaclass):
                 setattr(self, name, v)
                 i += 1
 
+        if self.TRACK_CHANGES:
+            self._changed = set()
+
         if len(args) > i:
             self.LOGGER.warning(
                 'Too many positional arguments passed. '
@@ -195,6 +337,62 @@ class Model(JsonSerializable, metaclass=ModelMetaclass):
             self.LOGGER.warning(
                 'Unknown fields passed: %s', extra_kwargs)
 
+    def _check_track_changes(self):
+        if not self.TRACK_CHANGES:
+            raise TypeError(
+                '{} does not track changes, set TRACK_CHANGES = True'.format(
+                    self.__class__.__name__))
+
+    def changed_fields(self):
+        """
+            Names of fields assigned since construction (or the last
+            mark_clean), in field order
+        """
+        self._check_track_changes()
+        changed = self._changed
+        if not changed:
+            return []
+        return [name for name in self._fields if name in changed]
+
+    def changes(self):
+        return collections.OrderedDict(
+            (name, getattr(self, name)) for name in self.changed_fields())
+
+    def db_changes(self):
+        """
+            changes() converted to DB column values with Field.to_db
+        """
+        return collections.OrderedDict(
+            (name, self._db_value(name)) for name in self.changed_fields())
+
+    def _db_value(self, name):
+        v = getattr(self, name)
+        if v is not None:
+            v = self._fields[name].to_db(v)
+        return v
+
+    def mark_clean(self):
+        self._check_track_changes()
+        self._changed = set()
+
+    def build_update_query(self, table, pk='id'):
+        """
+            SQLAlchemy UPDATE of table setting only changed columns
+            (values converted with Field.to_db), or None if nothing
+            has changed. The row is matched by the current pk value,
+            so the pk itself must not be changed
+        """
+        values = self.db_changes()
+        if not values:
+            return None
+        if pk in values:
+            raise ValueError(
+                'Primary key {} of {} is changed, the row to update is '
+                'unknown'.format(pk, self.__class__.__name__))
+        return table.update() \
+            .where(table.c[pk] == self._db_value(pk)) \
+            .values(**values)
+
     def __to_json__(self):
         res = {}
         for name, field in self._fields.items():
@@ -210,18 +408,229 @@ class Model(JsonSerializable, metaclass=ModelMetaclass):
             res[name] = v
         return res
 
+    @classmethod
+    def _json_row(cls):
+        """
+            Function model -> dict of json compatible values,
+            see compiler.compile_json_row
+        """
+        row = cls.__dict__.get('_json_row_func')
+        if row is None:
+            if cls.COMPILED \
+                    and compiler.is_compilable(cls, '__to_json__',
+                                               Model.__to_json__):
+                timestamp_fields = set()
+                nested_fields = set()
+                for name, f in cls._fields.items():
+                    if isinstance(f, UnixTimestampField):
+                        timestamp_fields.add(name)
+                    elif isinstance(f, ForeignModelField) \
+                            and f.__class__.transform_to_json \
+                            is ForeignModelField.transform_to_json:
+                        nested_fields.add(name)
+                row = compiler.compile_json_row(
+                    cls, timestamp_fields, nested_fields, _model_json_row)
+            else:
+                row = cls.__to_json__
+            cls._json_row_func = row
+        return row
+
+    @staticmethod
+    def dumps_json_list(models, charset='utf-8'):
+        """
+            Serializes a list of models straight to JSON bytes. Rows are
+            built with per-class compiled functions, so the json backend
+            gets only plain values and never calls back into python
+        """
+        rows = []
+        cls = row = None
+        for model in models:
+            if model.__class__ is not cls:
+                cls = model.__class__
+                row = cls._json_row()
+            rows.append(row(model))
+        return json_dumps_bytes(rows, charset)
+
+    @classmethod
+    def schema_hash(cls):
+        """
+            Checksum of class name, field names and types. Changes when
+            the model changes, so stale binary data is not misread
+        """
+        h = cls.__dict__.get('_schema_hash')
+        if h is None:
+            signature = '{}({})'.format(cls.__name__, ','.join(
+                '{}:{}'.format(name, f.schema_signature())
+                for name, f in cls._fields.items()))
+            h = zlib.crc32(signature.encode('utf-8'))
+            cls._schema_hash = h
+        return h
+
+    @classmethod
+    def _binary_plan(cls):
+        plan = cls.__dict__.get('_binary_fields')
+        if plan is None:
+            plan = [(name,
+                     f if f.overrides('to_binary') else None,
+                     f if f.overrides('from_binary') else None)
+                    for name, f in cls._fields.items()]
+            cls._binary_fields = plan
+        return plan
+
+    def _to_binary_values(self):
+        values = []
+        for name, field, _ in self._binary_plan():
+            v = getattr(self, name)
+            if field is not None and v is not None:
+                v = field.to_binary(v)
+            values.append(v)
+        return values
+
+    @classmethod
+    def _from_binary_values(cls, values):
+        plan = cls._binary_plan()
+        if len(values) != len(plan):
+            raise SchemaMismatchError(
+                'Expected {} values for {}, got {}'.format(
+                    len(plan), cls.__name__, len(values)))
+        kwargs = {}
+        for (name, _, field), v in zip(plan, values):
+            if field is not None and v is not None:
+                v = field.from_binary(v)
+            kwargs[name] = v
+        return cls._trusted_builder()(kwargs)
+
+    def dumps_binary(self):
+        """
+            Compact msgpack representation for caches: values are stored
+            positionally in field order after the schema hash, datetime
+            and enum types are preserved
+        """
+        return msgpack_typed_dumps(
+            [self.schema_hash()] + self._to_binary_values())
+
+    @classmethod
+    def loads_binary(cls, data):
+        values = msgpack_typed_loads(data)
+        if not isinstance(values, list) or len(values) == 0 \
+                or values[0] != cls.schema_hash():
+            raise SchemaMismatchError(
+                'Binary data does not match schema of {}'.format(
+                    cls.__name__))
+        return cls._from_binary_values(values[1:])
+
     def __repr__(self):
         fields = ['{}={}'.format(k, getattr(self, k)) for k in self._fields]
         return '<{} {}>'.format(self.__class__.__name__, ' '.join(fields))
 
     @classmethod
-    def parse(cls, d: dict):
+    def parse(cls, d: dict, trusted=False):
         if d is None:
             return None
+        if trusted:
+            return cls._trusted_builder()(d)
         return cls(**d)
 
     @classmethod
-    def parse_list(cls, l: list):
+    def parse_list(cls, l: list, trusted=False):
         if l is None or len(l) == 0:
             return []
+        if trusted:
+            return list(map(cls._trusted_builder(), l))
         return list(map(lambda d: cls(**d), l))
+
+    @classmethod
+    def trusted(cls, **kwargs):
+        """
+            Constructs model from already typed values (i.e. from a typed
+            DB driver): values are only assigned, transform_in and
+            transform_<name> hooks are not called. Use regular constructor
+            for untrusted input such as HTTP payloads.
+            Models with own __init__ (or a parent model's) are built by it,
+            so the hooks are called there: transform_in of the fields
+            keeps already typed values
+        """
+        return cls._trusted_builder()(kwargs)
+
+    @classmethod
+    def _trusted_builder(cls):
+        build = cls.__dict__.get('_trusted_build')
+        if build is None:
+            if not compiler.is_compilable(cls, '__init__', Model.__init__):
+                # own __init__ must run
+                def build(d):
+                    return cls(**d)
+            elif cls.COMPILED:
+                build = compiler.compile_trusted_builder(cls)
+            else:
+                build = cls._generic_trusted_builder()
+            cls._trusted_build = build
+        return build
+
+    @classmethod
+    def _generic_trusted_builder(cls):
+        """
+            Same as compiler.compile_trusted_builder for models which are
+            not compiled (COMPILED = False)
+        """
+        attrs = [(name, storage_name(name) if field.lazy else name,
+                  field.default)
+                 for name, field in cls._fields.items()]
+
+        def build(d):
+            self = cls.__new__(cls)
+            if cls.TRACK_CHANGES:
+                self._changed = None
+            for name, attr, default in attrs:
+                setattr(self, attr, d.get(name, default))
+            if cls.TRACK_CHANGES:
+                self._changed = set()
+            if not d.keys() <= cls._fields.keys():
+                compiler.warn_unknown_kwargs(self, d)
+            return self
+
+        return build
+
+    @classmethod
+    def from_rows(cls, rows, columns=None, raw_columns=None):
+        """
+            Builds models directly from DB rows (aiomysql RowProxy,
+            asyncpg Record, tuples) without converting them to dicts.
+
+            - columns
+                Column names of rows. Taken from rows[0].keys() if omitted
+
+            - raw_columns
+                Column names (or True for all) that the driver already
+                returns with the right type, so transform_in is skipped
+        """
+        if rows is None or len(rows) == 0:
+            return []
+        if columns is None:
+            columns = rows[0].keys()
+        columns = tuple(columns)
+
+        if not cls.COMPILED \
+                or not compiler.is_compilable(cls, '__init__', Model.__init__):
+            return [cls(**dict(zip(columns, row))) for row in rows]
+
+        unknown = set(columns) - set(cls._fields.keys())
+        if unknown:
+            cls.LOGGER.warning('Unknown fields passed: %s', unknown)
+
+        if raw_columns is None:
+            raw_columns = frozenset()
+        elif raw_columns is not True:
+            raw_columns = frozenset(raw_columns)
+
+        builders = cls.__dict__.get('_row_builders')
+        if builders is None or len(builders) > cls.ROW_BUILDERS_CACHE_SIZE:
+            builders = {}
+            cls._row_builders = builders
+
+        key = (columns, raw_columns)
+        build = builders.get(key)
+        if build is None:
+            build = compiler.compile_row_builder(cls, columns, raw_columns)
+            builders[key] = build
+        return list(map(build, rows))
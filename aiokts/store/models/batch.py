@@ -0,0 +1,268 @@
+import array
+import itertools
+import operator
+
+from aiokts.store.models import (BooleanField, IntField, UnixTimestampField)
+from aiokts.util.json_utils import json_dumps_bytes
+
+_features = {
+    'numpy': False
+}
+
+try:
+    import numpy
+    _features['numpy'] = True
+except ImportError:
+    pass
+
+__all__ = (
+    'ModelBatch',
+)
+
+# field class -> (array typecode, numpy dtype)
+NUMERIC_FIELDS = (
+    (BooleanField, 'b', 'bool'),
+    (UnixTimestampField, 'q', 'int64'),
+    (IntField, 'q', 'int64'),
+)
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def _numeric_type(field):
+    for field_cls, typecode, dtype in NUMERIC_FIELDS:
+        if isinstance(field, field_cls):
+            return typecode, dtype
+    return None
+
+
+def _is_numpy(column):
+    return _features['numpy'] and isinstance(column, numpy.ndarray)
+
+
+class ModelBatch(object):
+    """
+        Columnar storage of many rows of one Model class.
+
+        IntField, UnixTimestampField (as unix timestamp) and BooleanField
+        columns are stored in numpy arrays (if numpy is installed and
+        use_numpy is not False) or array.array, other fields (and numeric
+        ones containing None) in lists. Rows are turned into Model
+        instances only on access.
+
+        batch = ModelBatch.from_rows(Payment, rows)
+        paid = batch.filter(batch.mask('status', '==', 2))
+        paid.sum('amount')
+        paid.sort('created', reverse=True).row(0)
+    """
+
+    def __init__(self, model_cls, columns, length):
+        self.model_cls = model_cls
+        self.columns = columns
+        self._length = length
+
+    @classmethod
+    def from_dicts(cls, model_cls, dicts, use_numpy=None):
+        names = list(model_cls._fields.keys())
+        values = {name: [d.get(name) for d in dicts] for name in names}
+        return cls._build(model_cls, values, len(dicts), use_numpy)
+
+    @classmethod
+    def from_rows(cls, model_cls, rows, columns=None, use_numpy=None):
+        if len(rows) > 0 and columns is None:
+            columns = rows[0].keys()
+        positions = {c: i for i, c in enumerate(columns or ())}
+        values = {}
+        for name in model_cls._fields:
+            if name in positions:
+                i = positions[name]
+                values[name] = [row[i] for row in rows]
+            else:
+                values[name] = [None] * len(rows)
+        return cls._build(model_cls, values, len(rows), use_numpy)
+
+    @classmethod
+    def _build(cls, model_cls, values, length, use_numpy):
+        if use_numpy is None:
+            use_numpy = _features['numpy']
+        elif use_numpy and not _features['numpy']:
+            raise RuntimeError('numpy is not installed')
+
+        columns = {}
+        for name, field in model_cls._fields.items():
+            column = values[name]
+            numeric = _numeric_type(field)
+            if numeric is not None:
+                column = cls._make_numeric(field, column, numeric, use_numpy)
+            columns[name] = column
+        return cls(model_cls, columns, length)
+
+    @staticmethod
+    def _make_numeric(field, column, numeric, use_numpy):
+        typecode, dtype = numeric
+        for v in column:
+            if v is None:
+                return column
+        if isinstance(field, BooleanField):
+            column = [field.transform_in(v) for v in column]
+        else:
+            column = [int(v) for v in column]
+        if use_numpy:
+            return numpy.array(column, dtype=dtype)
+        return array.array(typecode, column)
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return '<{} of {} rows:{}>'.format(
+            self.__class__.__name__, self.model_cls.__name__, self._length)
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self.row(i)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def row(self, i):
+        kwargs = {}
+        for name, column in self.columns.items():
+            v = column[i]
+            if _is_numpy(column):
+                v = v.item()
+            kwargs[name] = v
+        return self.model_cls(**kwargs)
+
+    def to_models(self):
+        return list(self)
+
+    def take(self, indices):
+        """
+            New batch with rows at given indices (in that order)
+        """
+        indices = list(indices) if not _is_numpy(indices) else indices
+        columns = {}
+        for name, column in self.columns.items():
+            if _is_numpy(column):
+                columns[name] = column[indices]
+            elif isinstance(column, array.array):
+                columns[name] = array.array(column.typecode,
+                                            [column[i] for i in indices])
+            else:
+                columns[name] = [column[i] for i in indices]
+        return self.__class__(self.model_cls, columns, len(indices))
+
+    def mask(self, name, op, value):
+        """
+            Boolean mask of rows where `column op value`, i.e.
+            batch.mask('amount', '>', 100)
+        """
+        compare = OPERATORS[op]
+        column = self.columns[name]
+        if _is_numpy(column):
+            return compare(column, value)
+        return [v is not None and compare(v, value) for v in column]
+
+    def filter(self, mask):
+        if len(mask) != self._length:
+            raise ValueError('mask length {} != batch length {}'.format(
+                len(mask), self._length))
+        columns = {}
+        length = None
+        for name, column in self.columns.items():
+            if _is_numpy(column):
+                if not _is_numpy(mask):
+                    mask = numpy.array(mask, dtype=bool)
+                column = column[mask]
+            elif isinstance(column, array.array):
+                column = array.array(column.typecode,
+                                     itertools.compress(column, mask))
+            else:
+                column = list(itertools.compress(column, mask))
+            columns[name] = column
+            length = len(column)
+        if length is None:
+            length = sum(1 for m in mask if m)
+        return self.__class__(self.model_cls, columns, length)
+
+    def sort(self, name, reverse=False):
+        column = self.columns[name]
+        if _is_numpy(column):
+            indices = numpy.argsort(column, kind='mergesort')
+            if reverse:
+                indices = indices[::-1]
+        else:
+            # None values go first (last if reverse)
+            indices = sorted(range(self._length),
+                             key=lambda i: (column[i] is not None,
+                                            column[i]),
+                             reverse=reverse)
+        return self.take(indices)
+
+    def aggregate(self, name, func):
+        """
+            func: sum, min, max, mean or count (of not None values)
+        """
+        column = self.columns[name]
+        if _is_numpy(column):
+            if func == 'count':
+                return len(column)
+            if len(column) == 0:
+                return 0 if func == 'sum' else None
+            return getattr(column, func)().item()
+
+        values = column
+        if not isinstance(column, array.array):
+            values = [v for v in column if v is not None]
+        if func == 'count':
+            return len(values)
+        if func == 'sum':
+            return sum(values)
+        if len(values) == 0:
+            return None
+        if func == 'min':
+            return min(values)
+        if func == 'max':
+            return max(values)
+        if func == 'mean':
+            return sum(values) / len(values)
+        raise ValueError('Unknown aggregate function {}'.format(func))
+
+    def sum(self, name):
+        return self.aggregate(name, 'sum')
+
+    def min(self, name):
+        return self.aggregate(name, 'min')
+
+    def max(self, name):
+        return self.aggregate(name, 'max')
+
+    def mean(self, name):
+        return self.aggregate(name, 'mean')
+
+    def count(self, name):
+        return self.aggregate(name, 'count')
+
+    def iter_json(self, chunk_size=1000, charset='utf-8'):
+        """
+            Yields the batch serialized as a JSON array in chunks of bytes,
+            so only chunk_size Model instances exist at a time
+        """
+        yield b'['
+        for start in range(0, self._length, chunk_size):
+            stop = min(start + chunk_size, self._length)
+            chunk = json_dumps_bytes(
+                [self.row(i) for i in range(start, stop)], charset)
+            chunk = chunk[1:-1]
+            if start > 0:
+                chunk = b',' + chunk
+            yield chunk
+        yield b']'
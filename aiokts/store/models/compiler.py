@@ -0,0 +1,283 @@
+"""
+    Code generation of specialized Model methods.
+
+    Generated functions have all per-field work resolved at class creation
+    time: which fields need transform_in, which have per-model
+    transform_<name> hooks etc., so constructing an instance is a straight
+    sequence of assignments without string formatting and hasattr calls.
+"""
+import datetime
+
+from aiokts.store.models.lazy import LazyValue, storage_name
+from aiokts.util.json_utils import datetime_to_json
+
+_MISSING = object()
+
+TRANSFORM_ERROR = '{} for field `{}` in {}'
+
+
+def make_function(name, lines, namespace, cls):
+    code = '\n'.join(lines)
+    exec(compile(code, '<{}.{}>'.format(cls.__qualname__, name), 'exec'),
+         namespace)
+    func = namespace[name]
+    func.__qualname__ = '{}.{}'.format(cls.__qualname__, name)
+    func.__compiled__ = True
+    return func
+
+
+def is_compilable(cls, method_name, base_method):
+    """
+        Method is generated only if the class doesn't define its own
+        (neither directly nor in a parent model)
+    """
+    method = getattr(cls, method_name)
+    return method is base_method or getattr(method, '__compiled__', False)
+
+
+def model_transformer(cls, prefix, name):
+    transformer = getattr(cls, '{}{}'.format(prefix, name), None)
+    return transformer is not None and callable(transformer)
+
+
+def warn_unknown_kwargs(self, kwargs):
+    extra_kwargs = set(kwargs.keys()) - set(self._fields.keys())
+    if len(extra_kwargs) > 0:
+        self.LOGGER.warning('Unknown fields passed: %s', extra_kwargs)
+
+
+def compile_init(cls, generic_init):
+    """
+        Generates __init__ equivalent to generic_init (Model.__init__) for
+        keyword arguments. Positional arguments and calls on instances of
+        subclasses (via super().__init__) are passed to generic_init
+    """
+    ns = {
+        '_MISSING': _MISSING,
+        '_ERR': TRANSFORM_ERROR,
+        '_LazyValue': LazyValue,
+        '_cls': cls,
+        '_generic_init': generic_init,
+        '_warn_unknown_kwargs': warn_unknown_kwargs,
+    }
+    lines = [
+        'def __init__(self, *args, **kwargs):',
+        '    if args or self.__class__ is not _cls:',
+        '        _generic_init(self, *args, **kwargs)',
+        '        return',
+        '    used = 0',
+    ]
+    if cls.TRACK_CHANGES:
+        lines.append('    self._changed = None')
+    for i, (name, field) in enumerate(cls._fields.items()):
+        attr = storage_name(name) if field.lazy else name
+        ns['_default_{}'.format(i)] = field.default
+        lines += [
+            '    v = kwargs.get({!r}, _MISSING)'.format(name),
+            '    if v is _MISSING:',
+            '        self.{} = _default_{}'.format(attr, i),
+            '    else:',
+            '        used += 1',
+        ]
+        if field.lazy:
+            lines += [
+                '        if v is not None:',
+                '            v = _LazyValue(v)',
+                '        self.{} = v'.format(attr),
+            ]
+            continue
+
+        transform_lines = []
+        if field.overrides('transform_in'):
+            ns['_transform_in_{}'.format(i)] = field.transform_in
+            transform_lines += [
+                'try:',
+                '    v = _transform_in_{}(v)'.format(i),
+                'except Exception as e:',
+                '    raise Exception(_ERR.format(str(e), {!r}, '
+                'self.__class__))'.format(name),
+            ]
+        if model_transformer(cls, 'transform_', name):
+            transform_lines.append('v = self.transform_{}(v)'.format(name))
+        if transform_lines:
+            lines.append('        if v is not None:')
+            lines += ['            ' + line for line in transform_lines]
+        lines.append('        self.{} = v'.format(name))
+    if cls.TRACK_CHANGES:
+        lines.append('    self._changed = set()')
+    lines += [
+        '    if used != len(kwargs):',
+        '        _warn_unknown_kwargs(self, kwargs)',
+    ]
+    return make_function('__init__', lines, ns, cls)
+
+
+def compile_row_builder(cls, columns, raw_columns):
+    """
+        Generates function building an instance of cls from a positional
+        row (tuple, RowProxy, asyncpg Record...) with the given columns.
+        transform_in is skipped for raw_columns (or for all if True)
+    """
+    ns = {
+        '_ERR': TRANSFORM_ERROR,
+        '_LazyValue': LazyValue,
+        '_cls': cls,
+        '_new': cls.__new__,
+    }
+    positions = {}
+    for i, column in enumerate(columns):
+        positions.setdefault(column, i)
+
+    lines = [
+        'def build(row):',
+        '    self = _new(_cls)',
+    ]
+    if cls.TRACK_CHANGES:
+        lines.append('    self._changed = None')
+    for i, (name, field) in enumerate(cls._fields.items()):
+        attr = storage_name(name) if field.lazy else name
+        if name not in positions:
+            ns['_default_{}'.format(i)] = field.default
+            lines.append('    self.{} = _default_{}'.format(attr, i))
+            continue
+
+        lines.append('    v = row[{}]'.format(positions[name]))
+        raw = raw_columns is True or name in raw_columns
+        if field.lazy and not raw:
+            lines += [
+                '    if v is not None:',
+                '        v = _LazyValue(v)',
+                '    self.{} = v'.format(attr),
+            ]
+            continue
+
+        transform_lines = []
+        if not raw and field.overrides('transform_in'):
+            ns['_transform_in_{}'.format(i)] = field.transform_in
+            transform_lines += [
+                'try:',
+                '    v = _transform_in_{}(v)'.format(i),
+                'except Exception as e:',
+                '    raise Exception(_ERR.format(str(e), {!r}, '
+                '_cls))'.format(name),
+            ]
+        if model_transformer(cls, 'transform_', name):
+            transform_lines.append('v = self.transform_{}(v)'.format(name))
+        if transform_lines:
+            lines.append('    if v is not None:')
+            lines += ['        ' + line for line in transform_lines]
+        lines.append('    self.{} = v'.format(attr))
+    if cls.TRACK_CHANGES:
+        lines.append('    self._changed = set()')
+    lines.append('    return self')
+    return make_function('build', lines, ns, cls)
+
+
+def compile_to_json(cls):
+    """
+        Generates __to_json__ equivalent to Model.__to_json__: private
+        fields are dropped and identity transforms skipped at compile time.
+        Nested ForeignModelField values use their own compiled __to_json__
+    """
+    ns = {}
+    lines = [
+        'def __to_json__(self):',
+    ]
+    items = []
+    for i, (name, field) in enumerate(cls._fields.items()):
+        if field.private:
+            continue
+        var = 'v{}'.format(i)
+        lines.append('    {} = self.{}'.format(var, name))
+        transform_lines = []
+        if field.overrides('transform_to_json'):
+            ns['_transform_to_json_{}'.format(i)] = field.transform_to_json
+            transform_lines.append(
+                '{0} = _transform_to_json_{1}({0})'.format(var, i))
+        if model_transformer(cls, 'transform_json_', name):
+            transform_lines.append(
+                '{0} = self.transform_json_{1}({0})'.format(var, name))
+        if transform_lines:
+            lines.append('    if {} is not None:'.format(var))
+            lines += ['        ' + line for line in transform_lines]
+        items.append('{!r}: {}'.format(name, var))
+    lines.append('    return {{{}}}'.format(', '.join(items)))
+    return make_function('__to_json__', lines, ns, cls)
+
+
+def compile_json_row(cls, timestamp_fields, nested_fields, nested_row):
+    """
+        Generates function returning the same dict as __to_json__ but
+        with values the json encoder can't serialize itself converted
+        inline: datetimes of timestamp_fields with datetime_to_json and
+        models of nested_fields with nested_row. So serializing a list
+        of models doesn't call the encoder's default hook per value
+    """
+    ns = {
+        '_datetime': datetime.datetime,
+        '_datetime_to_json': datetime_to_json,
+        '_nested_row': nested_row,
+    }
+    lines = [
+        'def json_row(self):',
+    ]
+    items = []
+    for i, (name, field) in enumerate(cls._fields.items()):
+        if field.private:
+            continue
+        var = 'v{}'.format(i)
+        lines.append('    {} = self.{}'.format(var, name))
+        transform_lines = []
+        if name in nested_fields:
+            transform_lines.append('{0} = _nested_row({0})'.format(var))
+        elif field.overrides('transform_to_json'):
+            ns['_transform_to_json_{}'.format(i)] = field.transform_to_json
+            transform_lines.append(
+                '{0} = _transform_to_json_{1}({0})'.format(var, i))
+        if model_transformer(cls, 'transform_json_', name):
+            transform_lines.append(
+                '{0} = self.transform_json_{1}({0})'.format(var, name))
+        if name in timestamp_fields:
+            transform_lines += [
+                'if {}.__class__ is _datetime:'.format(var),
+                '    {0} = _datetime_to_json({0})'.format(var),
+            ]
+        if transform_lines:
+            lines.append('    if {} is not None:'.format(var))
+            lines += ['        ' + line for line in transform_lines]
+        items.append('{!r}: {}'.format(name, var))
+    lines.append('    return {{{}}}'.format(', '.join(items)))
+    return make_function('json_row', lines, ns, cls)
+
+
+def compile_trusted_builder(cls):
+    """
+        Generates function building an instance of cls from a dict of
+        already typed values: values are only assigned, without
+        transform_in and transform_<name> hooks
+    """
+    ns = {
+        '_cls': cls,
+        '_new': cls.__new__,
+        '_field_names': frozenset(cls._fields.keys()),
+        '_warn_unknown_kwargs': warn_unknown_kwargs,
+    }
+    lines = [
+        'def build(kwargs):',
+        '    self = _new(_cls)',
+    ]
+    if cls.TRACK_CHANGES:
+        lines.append('    self._changed = None')
+    for i, (name, field) in enumerate(cls._fields.items()):
+        attr = storage_name(name) if field.lazy else name
+        ns['_default_{}'.format(i)] = field.default
+        lines.append('    self.{} = kwargs.get({!r}, _default_{})'.format(
+            attr, name, i))
+    if cls.TRACK_CHANGES:
+        lines.append('    self._changed = set()')
+    lines += [
+        '    if not kwargs.keys() <= _field_names:',
+        '        _warn_unknown_kwargs(self, kwargs)',
+        '    return self',
+    ]
+    return make_function('build', lines, ns, cls)
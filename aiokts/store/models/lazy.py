@@ -0,0 +1,37 @@
+class LazyValue(object):
+    """
+        Raw (not yet decoded) value of a lazy field
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+
+def storage_name(name):
+    return '_lazy_{}'.format(name)
+
+
+class LazyFieldDescriptor(object):
+    """
+        Replaces a lazy field on the model class. The value is stored in
+        _lazy_<name> attribute (or slot) as LazyValue and is decoded with
+        field.decode on first access, then cached
+    """
+
+    def __init__(self, field, name):
+        self.field = field
+        self.name = name
+        self.storage = storage_name(name)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = getattr(instance, self.storage)
+        if value.__class__ is LazyValue:
+            value = self.field.decode(instance, value.raw)
+            setattr(instance, self.storage, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.storage, value)
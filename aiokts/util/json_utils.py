@@ -1,11 +1,16 @@
 import abc
+import binascii
 import json
+import os
+import re
 
 import datetime
 import time
 
 _features = {
-    'bson_object_id': False
+    'bson_object_id': False,
+    'orjson': False,
+    'ujson': False,
 }
 
 try:
@@ -14,29 +19,345 @@ try:
 except ImportError:
     pass
 
+try:
+    import orjson
+    _features['orjson'] = True
+except ImportError:
+    pass
+
+try:
+    import ujson
+    # default= is supported since ujson 5
+    ujson.dumps(None, default=str)
+    _features['ujson'] = True
+except (ImportError, TypeError):
+    pass
+
+
+class RawJson(object):
+    """
+        Already serialized JSON (str or bytes, i.e. a cached value) that
+        json_dumps/json_dumps_bytes/CustomJsonEncoder insert into the
+        output verbatim, without decoding and encoding it again.
+        The text is not validated
+    """
+    __slots__ = ('_text', '_data')
+
+    def __init__(self, text):
+        if isinstance(text, (bytes, bytearray, memoryview)):
+            self._text = None
+            self._data = bytes(text)
+        else:
+            self._text = text
+            self._data = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._data.decode('utf-8')
+        return self._text
+
+    def encode(self, charset='utf-8'):
+        if self._data is not None and \
+                charset.lower().replace('-', '') == 'utf8':
+            return self._data
+        return self.text.encode(charset)
+
+    def __repr__(self):
+        return '<RawJson {!r}>'.format(self.text[:50])
+
+
+# RawJson values are serialized as placeholder strings with a random
+# per-process nonce (so user data can't forge one) which are replaced
+# with the raw text after the backend has produced the output.
+# The values are kept in a list of the dumps call, not referenced
+# by the placeholder, so temporary ones (i.e. created in __to_json__)
+# live until they are spliced
+_RAW_NONCE = binascii.hexlify(os.urandom(8)).decode('ascii')
+_RAW_MARK = 'rawjson:{}:'.format(_RAW_NONCE)
+_RAW_MARK_BYTES = _RAW_MARK.encode('ascii')
+_RAW_RE = re.compile(r'"\\u0000{}(\d+)"'.format(_RAW_MARK))
+_RAW_RE_BYTES = re.compile(_RAW_RE.pattern.encode('ascii'))
+
+
+def _raw_placeholder(raws, raw):
+    raws.append(raw)
+    return '\x00{}{}'.format(_RAW_MARK, len(raws) - 1)
+
+
+def _get_raw(raws, m):
+    index = int(m.group(1))
+    if index >= len(raws):
+        raise ValueError(
+            'RawJson placeholder {} of another dumps call'.format(index))
+    return raws[index]
+
+
+def _splice_raw(s, raws):
+    if not raws:
+        return s
+    return _RAW_RE.sub(lambda m: _get_raw(raws, m).text, s)
+
+
+def _splice_raw_bytes(s, raws):
+    if not raws:
+        return s
+    return _RAW_RE_BYTES.sub(lambda m: _get_raw(raws, m).encode(), s)
+
+
+class _RawCollector(object):
+    """
+        default hook of one dumps call of orjson/ujson, collects
+        the RawJson values of the call
+    """
+    __slots__ = ('raws',)
+
+    def __init__(self):
+        self.raws = []
+
+    def default(self, obj):
+        if obj.__class__ is RawJson:
+            return _raw_placeholder(self.raws, obj)
+        return _json_default(obj)
+
+
+# local midnight timestamps by (year, month, day), see _local_day_start
+_local_days = {}
+LOCAL_DAYS_CACHE_SIZE = 8192
+
+
+def _local_zone(ts):
+    t = time.localtime(ts)
+    return t.tm_isdst, getattr(t, 'tm_gmtoff', None)
+
+
+def _local_day_start(year, month, day):
+    """
+        Timestamp of the local midnight of the day or None if the utc
+        offset changes around the day (DST switch), so time.mktime must
+        resolve its ambiguous or skipped hours
+    """
+    key = (year, month, day)
+    start = _local_days.get(key, False)
+    if start is False:
+        start = int(time.mktime((year, month, day, 0, 0, 0, 0, 0, -1)))
+        if _local_zone(start - 7200) != _local_zone(start + 93600):
+            start = None
+        if len(_local_days) >= LOCAL_DAYS_CACHE_SIZE:
+            _local_days.clear()
+        _local_days[key] = start
+    return start
+
+
+def datetime_to_json(obj):
+    """
+        datetime/date -> unix timestamp, naive values are local time.
+        Same as int(time.mktime(obj.timetuple())), but time.mktime is
+        called once per day, not per value. Call _local_days.clear()
+        after changing the process timezone with time.tzset()
+    """
+    cls = obj.__class__
+    if cls is datetime.date \
+            or (cls is datetime.datetime and obj.tzinfo is None):
+        start = _local_day_start(obj.year, obj.month, obj.day)
+        if start is not None:
+            if cls is datetime.date:
+                return start
+            return start + obj.hour * 3600 + obj.minute * 60 + obj.second
+    return int(time.mktime(obj.timetuple()))
+
+
+def _json_default(obj):
+    if isinstance(obj, JsonSerializable):
+        return obj.__to_json__()
+
+    if isinstance(obj, datetime.datetime) or isinstance(obj, datetime.date):
+        return datetime_to_json(obj)
+
+    if _features['bson_object_id']:
+        if isinstance(obj, ObjectId):
+            return str(obj)
+
+    raise TypeError(
+        'Object of type {} is not JSON serializable'.format(
+            obj.__class__.__name__))
+
 
 class CustomJsonEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, JsonSerializable):
-            return obj.__to_json__()
-        
-        if isinstance(obj, datetime.datetime) or isinstance(obj, datetime.date):
-            return int(time.mktime(obj.timetuple()))
-        
-        if _features['bson_object_id']:
-            if isinstance(obj, ObjectId):
-                return str(obj)
-        
-        return super(CustomJsonEncoder, self).default(obj)
+        if obj.__class__ is RawJson:
+            return _raw_placeholder(self._raws, obj)
+        try:
+            return _json_default(obj)
+        except TypeError:
+            return super(CustomJsonEncoder, self).default(obj)
+
+    def iterencode(self, o, _one_shot=False):
+        # RawJson placeholders may be split between chunks
+        self._raws = []
+        chunks = super(CustomJsonEncoder, self).iterencode(o, _one_shot)
+        return iter([_splice_raw(''.join(chunks), self._raws)])
 
 
 class JsonSerializable:
+    __slots__ = ()
+
     @abc.abstractmethod
     def __to_json__(self):
         raise NotImplementedError()
 
 
+class _StdlibJsonBackend(object):
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, cls=CustomJsonEncoder, ensure_ascii=False,
+                          separators=(',', ':'))
+
+    @classmethod
+    def dumps_bytes(cls, obj):
+        return cls.dumps(obj).encode('utf-8')
+
+    @staticmethod
+    def loads(s):
+        return json.loads(s)
+
+
+class _OrjsonBackend(object):
+    name = 'orjson'
+
+    # datetimes go to _json_default to stay unix timestamps, dataclasses
+    # to be rejected as by stdlib json
+    OPTIONS = 0
+    if _features['orjson']:
+        OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME \
+            | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+    @classmethod
+    def dumps(cls, obj):
+        return cls.dumps_bytes(obj).decode('utf-8')
+
+    @classmethod
+    def dumps_bytes(cls, obj):
+        collector = _RawCollector()
+        try:
+            return _splice_raw_bytes(
+                orjson.dumps(obj, default=collector.default,
+                             option=cls.OPTIONS),
+                collector.raws)
+        except TypeError:
+            # i.e. integers over 64 bits, stdlib json handles them
+            return _StdlibJsonBackend.dumps_bytes(obj)
+
+    # integers out of the 64 bit range are parsed by orjson as floats.
+    # Documents with 20 digits (or '-') in a row go to stdlib json, the
+    # digits are found by translate + find: much faster than re
+    _DIGITS_TABLE = bytes(ord('0') if chr(c) in '0123456789-' else ord(' ')
+                          for c in range(256))
+    _LONG_INT = b'0' * 20
+
+    @classmethod
+    def loads(cls, s):
+        if isinstance(s, str):
+            data = s.encode('utf-8', 'surrogatepass')
+        elif isinstance(s, memoryview):
+            data = s.tobytes()
+        else:
+            data = s
+        if data.translate(cls._DIGITS_TABLE).find(cls._LONG_INT) == -1:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # i.e. NaN, Infinity, 1e400, stdlib json accepts them
+                pass
+        return json.loads(s)
+
+
+class _UjsonBackend(object):
+    name = 'ujson'
+
+    @staticmethod
+    def dumps(obj):
+        collector = _RawCollector()
+        return _splice_raw(
+            ujson.dumps(obj, default=collector.default, ensure_ascii=False,
+                        escape_forward_slashes=False),
+            collector.raws)
+
+    @classmethod
+    def dumps_bytes(cls, obj):
+        return cls.dumps(obj).encode('utf-8')
+
+    @staticmethod
+    def loads(s):
+        return ujson.loads(s)
+
+
+_BACKENDS = {
+    'orjson': _OrjsonBackend,
+    'ujson': _UjsonBackend,
+    'json': _StdlibJsonBackend,
+}
+
+_backend = _StdlibJsonBackend
+
+
+def set_json_backend(name=None):
+    """
+        Selects the library used by json_dumps/json_loads:
+        'orjson', 'ujson', 'json' (stdlib) or None - the fastest installed
+
+        All backends serialize the same way JsonSerializable, datetime,
+        ObjectId, RawJson, str/int/bool/None/list/dict and floats
+        without an exponent. Differences from stdlib json:
+
+        - orjson
+            Floats with an exponent are written as 1e16, 1e-05 as
+            0.00001 (stdlib: 1e+16, 1e-05), NaN and Infinity as null.
+            Enum, UUID values and dict keys of these types and of
+            datetime are serialized instead of raising TypeError.
+            Loads gives the same values: documents orjson rejects
+            (NaN, Infinity, 1e400, lone surrogates) or with integers
+            which may be out of the 64 bit range (20 digits in a row)
+            are parsed by stdlib json
+
+        - ujson
+            1e-05 is written as 1e-5, Decimal is serialized as a number,
+            datetime and tuple dict keys are converted to str instead
+            of raising TypeError. Loads accepts control characters
+            in strings, which stdlib json rejects
+    """
+    global _backend
+    if name is None:
+        for name in ('orjson', 'ujson'):
+            if _features[name]:
+                break
+        else:
+            name = 'json'
+    if name not in _BACKENDS:
+        raise ValueError('Unknown json backend {}'.format(name))
+    if name != 'json' and not _features[name]:
+        raise RuntimeError('{} is not installed'.format(name))
+    _backend = _BACKENDS[name]
+
+
+def get_json_backend():
+    return _backend.name
+
+
+set_json_backend()
+
+
 def json_dumps(obj, compact=True, **kwargs):
+    """
+        Serializes obj with the selected backend. Non-compact output and
+        custom json.dumps kwargs (cls, indent, ...) use stdlib json
+    """
+    if obj.__class__ is RawJson:
+        return obj.text
+    if compact and not kwargs:
+        return _backend.dumps(obj)
     kwargs['cls'] = kwargs.get('cls', CustomJsonEncoder)
     kwargs['ensure_ascii'] = kwargs.get('ensure_ascii', False)
     if compact:
@@ -44,21 +365,36 @@ def json_dumps(obj, compact=True, **kwargs):
     return json.dumps(obj, **kwargs)
 
 
+def json_dumps_bytes(obj, charset='utf-8'):
+    """
+        Same as json_dumps(obj).encode(charset) without the intermediate
+        str for backends producing bytes
+    """
+    if obj.__class__ is RawJson:
+        return obj.encode(charset)
+    if charset.lower().replace('-', '') == 'utf8':
+        return _backend.dumps_bytes(obj)
+    return _backend.dumps(obj).encode(charset)
+
+
 def json_dump(fp, obj, compact=True, **kwargs):
     kwargs['cls'] = kwargs.get('cls', CustomJsonEncoder)
     kwargs['ensure_ascii'] = kwargs.get('ensure_ascii', False)
     if compact:
         kwargs['separators'] = (',', ':')
-    return json.dump(fp, obj, **kwargs)
+    return json.dump(obj, fp, **kwargs)
 
 
 def json_loads(obj, **kwargs):
-    kwargs['encoding'] = kwargs.get('encoding', 'utf-8')
+    # encoding is ignored (removed from json.loads in python 3.9)
+    kwargs.pop('encoding', None)
+    if not kwargs:
+        return _backend.loads(obj)
     return json.loads(obj, **kwargs)
 
 
 def json_load(fp, **kwargs):
-    kwargs['encoding'] = kwargs.get('encoding', 'utf-8')
+    kwargs.pop('encoding', None)
     return json.load(fp, **kwargs)
 
 
@@ -0,0 +1,159 @@
+import collections
+import sys
+import time
+
+__all__ = (
+    'LRUCache',
+)
+
+_sentinel = object()
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires_at')
+
+    def __init__(self, value, size, expires_at):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class LRUCache:
+    """
+        Bounded in-process key-value storage with LRU eviction and
+        per-key TTL.
+
+        - max_items
+            Максимальное количество ключей (None - без ограничения)
+
+        - max_size
+            Максимальный суммарный размер значений в байтах
+            (None - без ограничения)
+
+        - default_ttl
+            TTL в секундах для ключей, у которых он не указан явно
+            (None - ключи не протухают)
+
+        - sizeof
+            Функция подсчёта размера значения в байтах. По умолчанию
+            sys.getsizeof, который не учитывает вложенные объекты, так что
+            для контейнеров лучше передавать свою функцию
+    """
+
+    def __init__(self, max_items=None, max_size=None, default_ttl=None,
+                 sizeof=None, clock=time.monotonic):
+        self.max_items = max_items
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._sizeof = sizeof if sizeof is not None else sys.getsizeof
+        self._clock = clock
+        self._data = collections.OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _sentinel) is not _sentinel
+
+    def __repr__(self):
+        return '<{} items:{} size:{}>'.format(
+            self.__class__.__name__, len(self._data), self._size)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'items': len(self._data),
+            'size': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        if entry.expires_at is not None \
+                and entry.expires_at <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key, value, ttl=None, size=None):
+        """
+            Returns False if the value alone doesn't fit into max_size and
+            therefore was not stored
+        """
+        if size is None:
+            size = self._sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            self.delete(key)
+            return False
+
+        if ttl is None:
+            ttl = self.default_ttl
+        expires_at = self._clock() + ttl if ttl is not None else None
+
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = _Entry(value, size, expires_at)
+        self._size += size
+        self._evict()
+        return True
+
+    def delete(self, key):
+        if key in self._data:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self):
+        self._data.clear()
+        self._size = 0
+
+    def purge_expired(self):
+        now = self._clock()
+        expired = [k for k, e in self._data.items()
+                   if e.expires_at is not None and e.expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self._size -= entry.size
+
+    def _overflow(self):
+        if self.max_items is not None and len(self._data) > self.max_items:
+            return True
+        return self.max_size is not None and self._size > self.max_size
+
+    def _evict(self):
+        while self._data and self._overflow():
+            _, entry = self._data.popitem(last=False)
+            self._size -= entry.size
+            self.evictions += 1
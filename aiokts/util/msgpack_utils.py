@@ -0,0 +1,105 @@
+import datetime
+import struct
+
+from aiokts.util.json_utils import RawJson, _json_default, json_loads
+
+_features = {
+    'msgpack': False
+}
+
+try:
+    import msgpack
+    _features['msgpack'] = True
+except ImportError:
+    pass
+
+EXT_DATETIME = 1
+EXT_DATETIME_TZ = 2
+EXT_DATE = 3
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _check_msgpack():
+    if not _features['msgpack']:
+        raise RuntimeError('msgpack is not installed')
+
+
+def _ext_default(obj):
+    """
+        Keeps types of datetime values: naive datetimes are stored as
+        wall clock microseconds, aware ones with their utc offset
+    """
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is None:
+            us = (obj - _EPOCH) // _MICROSECOND
+            return msgpack.ExtType(EXT_DATETIME, struct.pack('>q', us))
+        offset = obj.utcoffset() // datetime.timedelta(minutes=1)
+        us = (obj.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+        return msgpack.ExtType(EXT_DATETIME_TZ,
+                               struct.pack('>qh', us, offset))
+    if isinstance(obj, datetime.date):
+        return msgpack.ExtType(EXT_DATE, struct.pack('>i', obj.toordinal()))
+    raise TypeError('Cannot serialize {!r}'.format(obj))
+
+
+def _ext_hook(code, data):
+    if code == EXT_DATETIME:
+        us, = struct.unpack('>q', data)
+        return _EPOCH + datetime.timedelta(microseconds=us)
+    if code == EXT_DATETIME_TZ:
+        us, offset = struct.unpack('>qh', data)
+        tz = datetime.timezone(datetime.timedelta(minutes=offset))
+        return (_EPOCH + datetime.timedelta(microseconds=us)) \
+            .replace(tzinfo=tz)
+    if code == EXT_DATE:
+        ordinal, = struct.unpack('>i', data)
+        return datetime.date.fromordinal(ordinal)
+    return msgpack.ExtType(code, data)
+
+
+def msgpack_typed_dumps(obj):
+    """
+        Packs obj preserving datetime/date types (for caches)
+    """
+    _check_msgpack()
+    return msgpack.packb(obj, default=_ext_default, use_bin_type=True)
+
+
+def msgpack_typed_loads(data):
+    _check_msgpack()
+    kwargs = {}
+    if msgpack.version >= (1, 0, 0):
+        kwargs['strict_map_key'] = False
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, **kwargs)
+
+
+def _json_compatible_default(obj):
+    if obj.__class__ is RawJson:
+        return json_loads(obj.text)
+    return _json_default(obj)
+
+
+def msgpack_dumps(obj):
+    """
+        Packs obj the same way json_dumps serializes it: __to_json__,
+        datetime -> unix timestamp, ObjectId -> str (for API responses)
+    """
+    _check_msgpack()
+    return msgpack.packb(obj, default=_json_compatible_default,
+                         use_bin_type=True)
+
+
+def msgpack_loads(data):
+    """
+        Raises ValueError for malformed data
+    """
+    _check_msgpack()
+    kwargs = {}
+    if msgpack.version >= (1, 0, 0):
+        kwargs['strict_map_key'] = False
+    try:
+        return msgpack.unpackb(data, raw=False, **kwargs)
+    except (ValueError, msgpack.exceptions.UnpackException) as e:
+        raise ValueError(str(e)) from e
@@ -0,0 +1,320 @@
+import asyncio
+import binascii
+import json
+import logging
+import os
+import random
+import time
+
+__all__ = (
+    'Span',
+    'Tracer',
+    'FileSpanExporter',
+    'OtlpHttpSpanExporter',
+    'NOOP_SPAN',
+    'span',
+)
+
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_CODE_ERROR = 2
+
+logger = logging.getLogger('aiokts.tracing')
+
+
+def _random_id(nbytes):
+    return binascii.hexlify(os.urandom(nbytes)).decode('ascii')
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans, service_name):
+    """
+        Builds OTLP/JSON ExportTraceServiceRequest payload
+    """
+    return {
+        'resourceSpans': [{
+            'resource': {
+                'attributes': [{
+                    'key': 'service.name',
+                    'value': _otlp_value(service_name)
+                }]
+            },
+            'scopeSpans': [{
+                'scope': {'name': 'aiokts'},
+                'spans': [s.to_otlp() for s in spans]
+            }]
+        }]
+    }
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    recording = False
+
+    def child(self, name, kind=SPAN_KIND_CLIENT, **attributes):
+        return self
+
+    def set_attribute(self, key, value):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span(object):
+    __slots__ = (
+        'trace_id',
+        'span_id',
+        'parent_id',
+        'name',
+        'kind',
+        'attributes',
+        'start_ns',
+        'end_ns',
+        'error',
+        '_started',
+        '_root',
+        '_tracer',
+        '_spans',
+    )
+
+    recording = True
+
+    def __init__(self, tracer, trace_id, name, kind, attributes,
+                 parent=None):
+        self.trace_id = trace_id
+        self.span_id = _random_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = int(time.time() * 1e9)
+        self.end_ns = None
+        self.error = None
+        self._started = time.perf_counter()
+        self._root = parent._root if parent is not None else self
+        self._tracer = tracer
+        self._spans = [] if parent is None else None
+
+    def __repr__(self):
+        return '<Span {} trace:{} span:{}>'.format(
+            self.name, self.trace_id, self.span_id)
+
+    @property
+    def duration(self):
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def child(self, name, kind=SPAN_KIND_CLIENT, **attributes):
+        root = self._root
+        if root.end_ns is not None \
+                or len(root._spans) >= self._tracer.max_spans_per_trace:
+            return NOOP_SPAN
+        return Span(self._tracer, self.trace_id, name, kind, attributes,
+                    parent=self)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + \
+            int((time.perf_counter() - self._started) * 1e9)
+        if error is not None:
+            self.error = error
+        root = self._root
+        if root is self:
+            self._spans.append(self)
+            self._tracer.export(self._spans)
+            self._spans = None
+        elif root._spans is not None:
+            root._spans.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(error=exc)
+        return False
+
+    def to_otlp(self):
+        d = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': k, 'value': _otlp_value(v)}
+                           for k, v in self.attributes.items()],
+        }
+        if self.parent_id is not None:
+            d['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            d['status'] = {
+                'code': STATUS_CODE_ERROR,
+                'message': '{}: {}'.format(self.error.__class__.__name__,
+                                           self.error)
+            }
+        return d
+
+
+class Tracer(object):
+    """
+        Creates root spans with head sampling: the decision is made once
+        per trace, non-sampled traces get NOOP_SPAN and cost nothing
+        in accessors.
+
+        - exporter
+            Object with export(spans) and close() methods
+            (FileSpanExporter, OtlpHttpSpanExporter)
+
+        - sample_rate
+            Доля запросов (0.0 - 1.0), для которых записываются спаны
+    """
+
+    def __init__(self, exporter, sample_rate=1.0, max_spans_per_trace=1000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.max_spans_per_trace = max_spans_per_trace
+
+    def start_trace(self, name, kind=SPAN_KIND_SERVER, **attributes):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        return Span(self, _random_id(16), name, kind, attributes)
+
+    def export(self, spans):
+        try:
+            self.exporter.export(spans)
+        except Exception:
+            logger.exception('Error while exporting spans')
+
+    def close(self):
+        return self.exporter.close()
+
+
+class _BatchSpanExporter(object):
+    def __init__(self, batch_size=100, service_name='aiokts'):
+        self.batch_size = batch_size
+        self.service_name = service_name
+        self._buffer = []
+
+    def export(self, spans):
+        self._buffer.extend(spans)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        self._write(self._encode(spans))
+
+    def close(self):
+        self.flush()
+
+    def _encode(self, spans):
+        return json.dumps(to_otlp(spans, self.service_name),
+                          separators=(',', ':'))
+
+    def _write(self, data):
+        raise NotImplementedError()
+
+
+class FileSpanExporter(_BatchSpanExporter):
+    """
+        Appends batches of spans to a file, one OTLP/JSON
+        ExportTraceServiceRequest per line
+    """
+
+    def __init__(self, path, batch_size=100, service_name='aiokts'):
+        super().__init__(batch_size=batch_size, service_name=service_name)
+        self.path = path
+
+    def _write(self, data):
+        with open(self.path, 'a') as f:
+            f.write(data)
+            f.write('\n')
+
+
+class OtlpHttpSpanExporter(_BatchSpanExporter):
+    """
+        Sends batches of spans to an OTLP/HTTP collector
+        (e.g. http://localhost:4318/v1/traces) in background
+    """
+
+    def __init__(self, endpoint, batch_size=100, service_name='aiokts',
+                 headers=None, timeout=5.0, loop=None):
+        super().__init__(batch_size=batch_size, service_name=service_name)
+        self.endpoint = endpoint
+        self.headers = dict(headers or {})
+        self.headers['Content-Type'] = 'application/json'
+        self.timeout = timeout
+        self.loop = loop
+        self._session = None
+        self._tasks = set()
+
+    def _write(self, data):
+        task = asyncio.ensure_future(self._send(data), loop=self.loop)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, data):
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(loop=self.loop)
+        try:
+            async with self._session.post(self.endpoint, data=data,
+                                          headers=self.headers,
+                                          timeout=self.timeout) as resp:
+                if resp.status >= 300:
+                    logger.warning('Collector responded with %s: %s',
+                                   resp.status, await resp.text())
+        except Exception as e:
+            logger.warning('Error while sending spans to %s: %s',
+                           self.endpoint, str(e))
+
+    async def close(self):
+        self.flush()
+        if self._tasks:
+            await asyncio.wait(self._tasks, loop=self.loop)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def span(ctx, name, **attributes):
+    """
+        Returns a child span of the ctx trace or NOOP_SPAN if ctx is None
+        or the request is not sampled. Usage:
+
+        with span(ctx, 'mysql.execute') as s:
+            ...
+    """
+    trace = getattr(ctx, 'trace', None)
+    if trace is None:
+        return NOOP_SPAN
+    return trace.child(name, **attributes)
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import struct
+import time
+
+from aiohttp import hdrs
+from aiohttp.web import Response
+
+from aiokts.util.arguments import ArgumentException, check_arguments
+from aiokts.util.json_utils import json_dumps
+from aiokts.util.lru import LRUCache
+from aiokts.web.response import KtsResponse
+
+__all__ = (
+    'cached_action',
+    'CachedResponse',
+    'BaseActionCache',
+    'MemoryActionCache',
+)
+
+# headers which are not stored with a cached response
+SKIPPED_HEADERS = frozenset((
+    hdrs.CONTENT_LENGTH,
+    hdrs.CONTENT_ENCODING,
+    hdrs.TRANSFER_ENCODING,
+    hdrs.DATE,
+    hdrs.SERVER,
+))
+
+
+class CachedResponse(object):
+    """
+        Serialized response: body bytes, status, headers and the time it
+        took to produce it originally (elapsed, seconds)
+    """
+    __slots__ = ('body', 'status', 'headers', 'elapsed')
+
+    def __init__(self, body, status, headers, elapsed):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.elapsed = elapsed
+
+    @classmethod
+    def from_response(cls, response, elapsed):
+        headers = [(k, v) for k, v in response.headers.items()
+                   if k not in SKIPPED_HEADERS]
+        return cls(bytes(response.body), response.status, headers, elapsed)
+
+    def to_response(self, ctx=None):
+        return KtsResponse(body=self.body, status=self.status,
+                           headers=self.headers, ctx=ctx)
+
+    def to_bytes(self):
+        """
+            For shared backends (redis, tarantool...)
+        """
+        meta = json.dumps([self.status, self.headers, self.elapsed])
+        meta = meta.encode('utf-8')
+        return struct.pack('>I', len(meta)) + meta + self.body
+
+    @classmethod
+    def from_bytes(cls, data):
+        size, = struct.unpack_from('>I', data)
+        status, headers, elapsed = json.loads(
+            data[4:4 + size].decode('utf-8'))
+        return cls(data[4 + size:], status,
+                   [tuple(h) for h in headers], elapsed)
+
+
+class BaseActionCache(object):
+    """
+        Storage of CachedResponse by key. Shared backends can use
+        CachedResponse.to_bytes/from_bytes
+    """
+
+    async def get(self, key):
+        raise NotImplementedError()
+
+    async def set(self, key, value, ttl):
+        raise NotImplementedError()
+
+
+class MemoryActionCache(BaseActionCache):
+    def __init__(self, max_items=1024, max_size=64 * 1024 * 1024):
+        self.cache = LRUCache(max_items=max_items, max_size=max_size,
+                              sizeof=lambda v: len(v.body))
+
+    async def get(self, key):
+        return self.cache.get(key)
+
+    async def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl=ttl)
+
+
+_default_backend = None
+
+
+def default_backend():
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = MemoryActionCache()
+    return _default_backend
+
+
+class ActionCacheStats(object):
+    __slots__ = ('hits', 'misses', 'stores', 'saved')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        # seconds of handling time saved by hits
+        self.saved = 0.0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_ratio': self.hit_ratio,
+            'saved_ms': self.saved * 1000.0,
+        }
+
+
+class CachedAction(object):
+    """
+        Caching settings of an action, see cached_action
+    """
+    CACHED_METHODS = (hdrs.METH_GET, hdrs.METH_HEAD)
+
+    def __init__(self, ttl, vary=None, backend=None, key_extra=None):
+        self.ttl = ttl
+        self.vary = frozenset(vary) if vary is not None else None
+        self.backend = backend
+        self.key_extra = key_extra
+        self.stats = ActionCacheStats()
+
+    def get_backend(self, view):
+        if self.backend is not None:
+            return self.backend
+        backend = getattr(view.app, 'action_cache', None)
+        if backend is not None:
+            return backend
+        return default_backend()
+
+    def make_key(self, view, action, method):
+        query = view.request.url.query
+        arglist = getattr(method, 'arglist', None)
+        if arglist is not None:
+            args = check_arguments(arglist, query, cast_type=True)
+        else:
+            args = dict(query)
+        if self.vary is not None:
+            args = {k: v for k, v in args.items() if k in self.vary}
+        parts = [
+            view.request.path,
+            action,
+            json_dumps(args, sort_keys=True),
+        ]
+        if hasattr(view, 'response_content_type'):
+            parts.append(view.response_content_type())
+        if self.key_extra is not None:
+            parts.append(str(self.key_extra(view)))
+        digest = hashlib.sha1('\x00'.join(parts).encode('utf-8'))
+        return 'action:{}'.format(digest.hexdigest())
+
+    async def lookup(self, view, action, method):
+        """
+            Returns (response, key). response is None on a miss,
+            key is None if the request is not cacheable
+        """
+        if view.request.method not in self.CACHED_METHODS:
+            return None, None
+        try:
+            key = self.make_key(view, action, method)
+        except ArgumentException:
+            # the action reports invalid arguments itself
+            return None, None
+
+        started = time.perf_counter()
+        cached = await self.get_backend(view).get(key)
+        if cached is None:
+            self.stats.misses += 1
+            return None, key
+        self.stats.hits += 1
+        response = cached.to_response(ctx=view.ctx)
+        self.stats.saved += max(
+            0.0, cached.elapsed - (time.perf_counter() - started))
+        return response, key
+
+    async def store(self, view, key, response, elapsed):
+        if key is None or not isinstance(response, Response) \
+                or response.status != 200 \
+                or not isinstance(response.body, (bytes, bytearray)) \
+                or hdrs.SET_COOKIE in response.headers \
+                or 'no-store' in response.headers.get(hdrs.CACHE_CONTROL, ''):
+            return
+        cached = CachedResponse.from_response(response, elapsed)
+        await self.get_backend(view).set(key, cached, self.ttl)
+        self.stats.stores += 1
+
+
+def cached_action(ttl, vary=None, backend=None, key_extra=None):
+    """
+        Caches the serialized response of an ActionBaseView action
+        (GET and HEAD only). A hit skips before_action, the action and
+        json serialization.
+
+        - ttl
+            Время жизни в секундах
+
+        - vary
+            Имена аргументов, от которых зависит ответ. По умолчанию все
+            аргументы из @arguments_params (после валидации и приведения
+            типов), либо весь query, если @arguments_params нет
+
+        - backend
+            BaseActionCache. По умолчанию app.action_cache или общий
+            MemoryActionCache
+
+        - key_extra
+            Функция view -> str для дополнительной части ключа,
+            например id пользователя для персональных ответов
+
+        Stats: View.action._cached_action_.stats.as_dict()
+    """
+    spec = CachedAction(ttl, vary=vary, backend=backend, key_extra=key_extra)
+
+    def _cached_action(func):
+        func._cached_action_ = spec
+        return func
+
+    return _cached_action
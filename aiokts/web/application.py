@@ -1,5 +1,8 @@
+import asyncio
+
 from aiohttp import web
 
+from aiokts.web.compression import CompressionMiddleware
 from aiokts.web.context import Context
 from aiokts.web.handler import KtsAccessLogger
 from aiokts.web.request import KtsRequest
@@ -11,14 +14,49 @@ sentinel = object()
 class KtsHttpApplication(web.Application):
     ROUTES = []
 
+    # path of the batch endpoint (i.e. '/batch'), None - disabled
+    BATCH_ROUTE = None
+    BATCH_VIEW_CLS = None
+
     def __init__(self, **kwargs):
         kwargs['debug'] = kwargs.get('debug', False)
+        self.tracer = kwargs.pop('tracer', None)
+        # default backend of @cached_action
+        self.action_cache = kwargs.pop('action_cache', None)
+
+        # True, CompressionMiddleware kwargs or its instance
+        compression = kwargs.pop('compression', None)
+        if compression is True:
+            compression = CompressionMiddleware()
+        elif isinstance(compression, dict):
+            compression = CompressionMiddleware(**compression)
+        self.compression = compression or None
+        if self.compression is not None:
+            # outermost, so it gets the final response
+            kwargs['middlewares'] = \
+                [self.compression] + list(kwargs.get('middlewares') or ())
+
         super().__init__(**kwargs)
 
         for route in self.ROUTES:
             method, path, view_cls = route
             self.router.add_route(method, path, view_cls)
 
+        if self.BATCH_ROUTE is not None:
+            batch_view_cls = self.BATCH_VIEW_CLS
+            if batch_view_cls is None:
+                from aiokts.web.batch import BatchView
+                batch_view_cls = BatchView
+            self.router.add_route('POST', self.BATCH_ROUTE, batch_view_cls)
+
+        if self.tracer is not None:
+            self.on_cleanup.append(self._close_tracer)
+
+    async def _close_tracer(self, app):
+        res = self.tracer.close()
+        if asyncio.iscoroutine(res):
+            await res
+
     def _make_request(self, message, payload, protocol, writer, task,
                       _cls=KtsRequest):
         req = super()._make_request(message, payload, protocol, writer, task,
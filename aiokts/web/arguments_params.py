@@ -5,6 +5,27 @@ from aiokts.util.arguments import check_arguments
 from aiokts.web.error import ServerError
 
 
+async def _load_body(view):
+    if hasattr(view, 'get_request_data') and \
+            view.request.content_type.startswith('application/json'):
+        # BaseView: parsed once with its body size limit and json loader
+        return await view.get_request_data()
+    if hasattr(view, 'accepts_msgpack_body') and view.accepts_msgpack_body():
+        return await view.get_request_data()
+    try:
+        return await view.request.json()
+    except json.JSONDecodeError:
+        raise ServerError(ServerError.BAD_REQUEST(
+            message='Body must be a valid json'))
+
+
+async def _load_form(view):
+    if hasattr(view, 'read_form'):
+        # BaseView: with its body size limit
+        return await view.read_form()
+    return await view.request.post()
+
+
 def arguments_params(arglist=None):
     if arglist is None:
         arglist = {}
@@ -15,14 +36,12 @@ def arguments_params(arglist=None):
             if self.request.method == 'GET':
                 source = self.request.url.query
             else:
-                if self.request.content_type.startswith('application/json'):
-                    try:
-                        source = await self.request.json()
-                    except json.JSONDecodeError:
-                        raise ServerError(ServerError.BAD_REQUEST(
-                            message='Body must be a valid json'))
+                if self.request.content_type.startswith('application/json') \
+                        or hasattr(self, 'accepts_msgpack_body') \
+                        and self.accepts_msgpack_body():
+                    source = await _load_body(self)
                 else:
-                    source = await self.request.post()
+                    source = await _load_form(self)
             checked_args = check_arguments(arglist, source, cast_type=True)
             kwargs.update(checked_args)
             return await func(self, *args, **kwargs)
@@ -60,7 +79,7 @@ def arguments_params_post(arglist=None):
     def _arguments(func):
         @functools.wraps(func)
         async def inner(self, *args, **kwargs):
-            data = await self.request.post()
+            data = await _load_form(self)
             checked_args = check_arguments(arglist, data, cast_type=True)
             kwargs.update(checked_args)
             return await func(self, *args, **kwargs)
@@ -79,11 +98,7 @@ def arguments_params_json(arglist=None):
     def _arguments(func):
         @functools.wraps(func)
         async def inner(self, *args, **kwargs):
-            try:
-                data = await self.request.json()
-            except json.JSONDecodeError:
-                raise ServerError(ServerError.BAD_REQUEST(
-                    message='Body must be a valid json'))
+            data = await _load_body(self)
             checked_args = check_arguments(arglist, data, cast_type=True)
             kwargs.update(checked_args)
             return await func(self, *args, **kwargs)
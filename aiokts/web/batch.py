@@ -0,0 +1,175 @@
+import asyncio
+
+from aiohttp import hdrs
+from aiohttp.web import Response
+from aiohttp.web_exceptions import HTTPException
+from multidict import CIMultiDict
+from yarl import URL
+
+from aiokts.util.json_utils import RawJson, json_dumps, json_dumps_bytes
+from aiokts.web.error import ServerError
+from aiokts.web.response import JSON_CONTENT_TYPE, ApiErrorResponse
+from aiokts.web.view import BaseView
+
+__all__ = (
+    'BatchView',
+)
+
+# headers of the batch request which are not passed to sub-requests
+SKIPPED_HEADERS = frozenset((
+    hdrs.CONTENT_LENGTH,
+    hdrs.CONTENT_TYPE,
+    hdrs.CONTENT_ENCODING,
+    hdrs.TRANSFER_ENCODING,
+    hdrs.ACCEPT,
+    hdrs.ACCEPT_ENCODING,
+    hdrs.IF_NONE_MATCH,
+    hdrs.EXPECT,
+))
+
+
+def _query_value(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return json_dumps(value)
+
+
+class BatchView(BaseView):
+    """
+        Executes several API requests in one:
+
+        POST /batch
+        {"requests": [
+            {"method": "GET", "path": "/user.get", "args": {"id": 1}},
+            {"method": "POST", "path": "/order.create", "args": {...}}
+        ]}
+
+        Sub-requests are dispatched through the application (router,
+        middlewares, views) concurrently, each with its own Context,
+        and share headers (i.e. auth) of the batch request. GET args
+        go to the query, others to a json body.
+
+        Response data is a list in the order of requests:
+        {"http_status": 200, "body": <api response of the sub-request>}
+        Errors of sub-requests have ApiErrorResponse format.
+
+        Enabled with KtsHttpApplication.BATCH_ROUTE
+    """
+    MAX_REQUESTS = 20
+    CONCURRENCY = 5
+
+    async def post(self):
+        data = await self.get_request_data()
+        if isinstance(data, dict):
+            data = data.get('requests')
+        if not isinstance(data, list):
+            raise ServerError(ServerError.BAD_REQUEST(
+                message='requests must be a list'))
+        if len(data) > self.MAX_REQUESTS:
+            raise ServerError(ServerError.BAD_REQUEST(
+                message='Max {} requests allowed'.format(self.MAX_REQUESTS)))
+
+        semaphore = asyncio.Semaphore(self.CONCURRENCY)
+        results = await asyncio.gather(*[
+            self._run_limited(semaphore, i, sub)
+            for i, sub in enumerate(data)
+        ])
+        return self.response_api_ok(results)
+
+    async def _run_limited(self, semaphore, i, sub):
+        async with semaphore:
+            try:
+                return await self.run_request(i, sub)
+            except ServerError as e:
+                return self._error_result(e.error.http_code or 500,
+                                          e.error.message, code=e.error.code)
+            except Exception as e:
+                self.logger.exception('Batch request #%s failed: %s', i, e)
+                return self._error_result(500, 'Internal Server Error')
+
+    @staticmethod
+    def _error_result(http_status, message, **extra):
+        return {
+            'http_status': http_status,
+            'body': ApiErrorResponse.generate_response_dict(
+                message=message, data={}, **extra),
+        }
+
+    def _bad_request(self, message):
+        raise ServerError(ServerError.BAD_REQUEST(message=message))
+
+    def make_sub_request(self, i, sub):
+        if not isinstance(sub, dict):
+            self._bad_request('request must be an object')
+        method = sub.get('method', hdrs.METH_GET)
+        path = sub.get('path')
+        args = sub.get('args') or {}
+        if not isinstance(method, str) or not isinstance(path, str) \
+                or not path.startswith('/') or not isinstance(args, dict):
+            self._bad_request('request must have path and args object')
+        method = method.upper()
+        url = URL(path)
+        if url.path == self.request.path:
+            self._bad_request('Nested batch requests are not allowed')
+
+        headers = CIMultiDict(
+            (k, v) for k, v in self.request.headers.items()
+            if k not in SKIPPED_HEADERS)
+        headers[hdrs.ACCEPT] = JSON_CONTENT_TYPE
+        headers[hdrs.ACCEPT_ENCODING] = 'identity'
+        if method == hdrs.METH_GET:
+            if args:
+                url = url.update_query(
+                    {k: _query_value(v) for k, v in args.items()})
+            body = b''
+        else:
+            body = json_dumps_bytes(args)
+            headers[hdrs.CONTENT_TYPE] = JSON_CONTENT_TYPE
+        headers[hdrs.CONTENT_LENGTH] = str(len(body))
+
+        # aiohttp refuses to clone a request with read content, body of
+        # the batch request is not needed by sub-requests anyway
+        read_bytes = self.request._read_bytes
+        self.request._read_bytes = None
+        try:
+            request = self.request.clone(method=method, rel_url=url,
+                                         headers=headers)
+        finally:
+            self.request._read_bytes = read_bytes
+        # body is already in memory, request.read()/json()/post() use it
+        request._read_bytes = body
+        if hasattr(request, 'set_context'):
+            ctx = self.app.make_context(request)
+            ctx.hash = '{}.{}'.format(self.ctx.hash, i)
+            ctx.log_request()
+            request.set_context(ctx)
+        return request
+
+    async def run_request(self, i, sub):
+        request = self.make_sub_request(i, sub)
+        try:
+            response = await self.app._handle(request)
+        except HTTPException as e:
+            return self._error_result(e.status_code, e.reason)
+        return self.make_result(response)
+
+    def make_result(self, response):
+        if not isinstance(response, Response) or response.body is None:
+            return self._error_result(
+                500, 'Response of {} can not be batched'.format(
+                    response.__class__.__name__))
+        body = response.body
+        if response.content_type == JSON_CONTENT_TYPE:
+            # embedded as is, without decoding
+            body = RawJson(bytes(body))
+        elif response.status >= 400:
+            # aiohttp HTTPException
+            return self._error_result(response.status, response.reason)
+        else:
+            body = bytes(body).decode(response.charset or 'utf-8')
+        return {
+            'http_status': response.status,
+            'body': body,
+        }
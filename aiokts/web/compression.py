@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import zlib
+
+from aiohttp import hdrs
+from aiohttp.web import Response
+
+from aiokts.util.lru import LRUCache
+
+_features = {
+    'brotli': False
+}
+
+try:
+    import brotli
+    _features['brotli'] = True
+except ImportError:
+    pass
+
+__all__ = (
+    'CompressionMiddleware',
+)
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/x-msgpack',
+    'application/javascript',
+    'application/xml',
+    'text/',
+)
+
+# preferred first when client accepts several with the same q
+CODINGS_PREFERENCE = ('br', 'gzip', 'deflate')
+
+NOT_COMPRESSED_STATUSES = frozenset((204, 206, 304))
+
+
+def parse_accept_encoding(header):
+    """
+        Returns {coding: q} of Accept-Encoding header value
+    """
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class CompressionMiddleware(object):
+    """
+        aiohttp middleware compressing Response bodies with gzip, deflate
+        or brotli (if installed) negotiated from Accept-Encoding.
+
+        Unlike response.enable_compression() it has a size threshold,
+        compresses large bodies in an executor (so the event loop is not
+        blocked) and keeps an LRU of precompressed bodies of GET
+        responses, so a hot response is compressed once.
+
+        - min_size
+            Не сжимать тела меньше этого размера в байтах
+
+        - level, brotli_quality
+            Степень сжатия gzip/deflate и brotli
+
+        - executor_threshold
+            Тела от этого размера сжимаются в executor (None - всегда
+            в event loop)
+
+        - cache_items, cache_size
+            Ограничения LRU сжатых тел по количеству и по суммарному
+            размеру в байтах (cache_items=0 - без кэша). Ключ - хэш
+            несжатого тела, так что кэш не может отдать устаревшие данные
+
+        Enabled with KtsHttpApplication(compression=True) or
+        compression={...kwargs...}
+    """
+    __middleware_version__ = 1
+
+    def __init__(self, min_size=1024, level=6, brotli_quality=4,
+                 codings=None, executor_threshold=64 * 1024, executor=None,
+                 cache_items=256, cache_size=32 * 1024 * 1024):
+        if codings is None:
+            codings = [c for c in CODINGS_PREFERENCE
+                       if c != 'br' or _features['brotli']]
+        elif 'br' in codings and not _features['brotli']:
+            raise RuntimeError('brotli is not installed')
+
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.codings = tuple(codings)
+        self.executor_threshold = executor_threshold
+        self.executor = executor
+        self.cache = None
+        if cache_items:
+            self.cache = LRUCache(max_items=cache_items, max_size=cache_size,
+                                  sizeof=len)
+
+    async def __call__(self, request, handler):
+        response = await handler(request)
+        if self.is_compressible(request, response):
+            await self.compress_response(request, response)
+        return response
+
+    def is_compressible(self, request, response):
+        if not isinstance(response, Response):
+            # StreamResponse writes its body itself
+            return False
+        if request.method == 'HEAD' \
+                or response.status in NOT_COMPRESSED_STATUSES \
+                or hdrs.CONTENT_ENCODING in response.headers:
+            return False
+        body = response.body
+        if not isinstance(body, (bytes, bytearray)) \
+                or len(body) < self.min_size:
+            return False
+        return response.content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def negotiate(self, request):
+        """
+            Best coding accepted by the client or None
+        """
+        header = request.headers.get(hdrs.ACCEPT_ENCODING)
+        if not header:
+            return None
+        accepted = parse_accept_encoding(header)
+        any_q = accepted.get('*', 0.0)
+        best, best_q = None, 0.0
+        for coding in self.codings:
+            q = accepted.get(coding, any_q)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, coding, body):
+        if coding == 'br':
+            return brotli.compress(bytes(body), quality=self.brotli_quality)
+        if coding == 'gzip':
+            wbits = 16 + zlib.MAX_WBITS
+        else:
+            wbits = zlib.MAX_WBITS
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+        return compressor.compress(body) + compressor.flush()
+
+    async def compress_response(self, request, response):
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        coding = self.negotiate(request)
+        if coding is None:
+            return
+
+        body = response.body
+        key = None
+        if self.cache is not None and request.method == 'GET' \
+                and response.status == 200 \
+                and 'no-store' not in response.headers.get(
+                    hdrs.CACHE_CONTROL, ''):
+            key = (coding, hashlib.sha1(body).digest())
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                self._set_body(response, coding, compressed)
+                return
+
+        if self.executor_threshold is not None \
+                and len(body) >= self.executor_threshold:
+            loop = asyncio.get_event_loop()
+            compressed = await loop.run_in_executor(
+                self.executor, self.compress, coding, body)
+        else:
+            compressed = self.compress(coding, body)
+
+        if key is not None:
+            self.cache.set(key, compressed)
+        self._set_body(response, coding, compressed)
+
+    @staticmethod
+    def _set_body(response, coding, compressed):
+        response.headers.pop(hdrs.CONTENT_LENGTH, None)
+        response.body = compressed
+        response.headers[hdrs.CONTENT_ENCODING] = coding
+        # compressed bytes differ per coding, so the ETag of the
+        # uncompressed body may only be a weak validator
+        etag = response.headers.get(hdrs.ETAG)
+        if etag is not None and not etag.startswith('W/'):
+            response.headers[hdrs.ETAG] = 'W/' + etag
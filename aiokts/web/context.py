@@ -1,5 +1,7 @@
+import binascii
+import itertools
 import logging
-import uuid
+import os
 import weakref
 
 from aiohttp.helpers import reify
@@ -10,21 +12,58 @@ __all__ = [
 ]
 
 
-class ContextLogger(logging.Logger):
-    def __init__(self, ctx, name='ctxLogger', parent=logging.root):
-        super(ContextLogger, self).__init__(name)
+ctx_logger = logging.getLogger('ctxLogger')
+
+
+class ContextLogger(logging.LoggerAdapter):
+    """
+        Adapter of the shared ctxLogger logger prefixing messages with
+        ctx.log_prepend and ctx.log_append. Messages are formatted only
+        if the level is enabled
+    """
+
+    def __init__(self, ctx, logger=None):
+        super(ContextLogger, self).__init__(logger or ctx_logger, None)
         self._ctx = ctx
-        self.parent = parent
 
     @property
     def ctx(self):
         return self._ctx
 
-    def _log(self, level, msg, args, exc_info=None,
-             extra=None, stack_info=False):
-        msg = '{}{}{}'.format(self.ctx.log_prepend, msg, self.ctx.log_append)
-        return super(ContextLogger, self)._log(level, msg, args, exc_info,
-                                               extra, stack_info)
+    def process(self, msg, kwargs):
+        msg = '{}{}{}'.format(self._ctx.log_prepend, msg,
+                              self._ctx.log_append)
+        return msg, kwargs
+
+
+class _HashGenerator(object):
+    """
+        Request ids: random per-process prefix + counter. The prefix
+        is regenerated in a forked child, so workers do not repeat ids
+    """
+
+    # python < 3.7 has no os.register_at_fork, a fork is detected by
+    # comparing the pid on every call there
+    CHECK_PID = not hasattr(os, 'register_at_fork')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.prefix = binascii.hexlify(os.urandom(3)).decode('ascii')
+        self.counter = itertools.count()
+
+    def __call__(self):
+        if self.CHECK_PID and os.getpid() != self.pid:
+            self.reset()
+        return '{}{:04x}'.format(self.prefix, next(self.counter))
+
+
+_hash_generator = _HashGenerator()
+
+if not _HashGenerator.CHECK_PID:
+    os.register_at_fork(after_in_child=_hash_generator.reset)
 
 
 class ContextDataObject(object):
@@ -38,6 +77,18 @@ class ContextDataObject(object):
         return None
 
 
+# remembered absence of an entity in the identity map
+_MISS = object()
+
+
+class _AffineConnection(object):
+    __slots__ = ('conn', 'busy')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.busy = True
+
+
 class Context(object):
     CONTEXT_DATA_OBJECT_CLS = ContextDataObject
 
@@ -45,46 +96,166 @@ class Context(object):
         '_request',
         '_view',
         'hash',
-        'logger',
+        '_logger',
         '_data',
         '_cache',
+        '_conns',
+        '_conns_released',
+        '_entities',
+        'trace',
         '__weakref__',
     ]
 
     def __init__(self, request):
         self._request = weakref.ref(request) if request is not None else None
         self.hash = self._generate_hash()
-        self.logger = ContextLogger(self)
-        self._data = self.CONTEXT_DATA_OBJECT_CLS()
+        self._logger = None
+        self._data = None
 
         self._cache = {}
+        self._conns = None
+        self._conns_released = False
+        self._entities = None
+        self.trace = None
 
     @property
     def request(self):
         return self._request() if self._request is not None else None
 
+    @property
+    def logger(self):
+        if self._logger is None:
+            self._logger = ContextLogger(self)
+        return self._logger
+
+    @logger.setter
+    def logger(self, value):
+        self._logger = value
+
     def log_request(self):
-        if self._request is not None:
-            if not self.request.query_string:
-                q = self.request.query_string
-            else:
-                q = '?' + self.request.query_string
-            self.logger.info('Request {method} {path}{query}'.format(
-                method=self.request.method,
-                path=self.request.path,
-                query=q
-            ))
+        request = self.request
+        if request is None:
+            return
+        # the adapter is created lazily, check the module logger first
+        # so it is not created at all when INFO is disabled
+        logger = self._logger or ctx_logger
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        q = request.query_string
+        if q:
+            q = '?' + q
+        self.logger.info('Request %s %s%s', request.method, request.path, q)
 
     @staticmethod
     def _generate_hash():
-        h = uuid.uuid4().hex
-        h = h[:10]
-        return h
+        return _hash_generator()
 
     @property
     def data(self):
+        if self._data is None:
+            self._data = self.CONTEXT_DATA_OBJECT_CLS()
         return self._data
 
+    async def acquire_conn(self, connector, **kwargs):
+        """
+            Returns a connection of the connector bound to this request.
+            The first call acquires it from the pool, subsequent calls reuse
+            it. If the bound connection is busy with a concurrent query
+            of the same request, a separate pooled connection is returned.
+            Every acquire_conn must be paired with release_conn
+        """
+        if self._conns_released:
+            return await connector.get_conn(**kwargs)
+
+        if self._conns is None:
+            self._conns = {}
+
+        affine = self._conns.get(connector)
+        if affine is not None:
+            if affine.busy:
+                return await connector.get_conn(**kwargs)
+            affine.busy = True
+            return affine.conn
+
+        conn = await connector.get_conn(**kwargs)
+        if not self._conns_released and connector not in self._conns:
+            self._conns[connector] = _AffineConnection(conn)
+        return conn
+
+    def release_conn(self, connector, conn, discard=False):
+        """
+            Marks the bound connection as free or releases a non-bound one
+            to the pool. discard=True unbinds the connection (e.g. after
+            a failed query) and returns it to the pool
+        """
+        affine = self._conns.get(connector) if self._conns else None
+        if affine is None or affine.conn is not conn:
+            connector.release(conn)
+        elif discard:
+            del self._conns[connector]
+            connector.release(conn)
+        else:
+            affine.busy = False
+
+    def release_conns(self):
+        """
+            Releases all connections bound to this request. Called when
+            the request is handled (or cancelled)
+        """
+        self._conns_released = True
+        conns, self._conns = self._conns, None
+        if not conns:
+            return
+        for connector, affine in conns.items():
+            # a busy connection is released by its query via release_conn
+            if not affine.busy:
+                connector.release(affine.conn)
+
+    def get_entity(self, model_cls, id):
+        """
+            Returns the entity loaded earlier in this request or None.
+            Raises model_cls.DoesNotExist if the entity is remembered
+            as absent
+        """
+        if self._entities is None:
+            return None
+        entity = self._entities.get((model_cls, id))
+        if entity is _MISS:
+            raise model_cls.DoesNotExist(id)
+        return entity
+
+    def put_entity(self, model_cls, id, entity):
+        """
+            Remembers the entity for the rest of the request.
+            entity=None remembers that it does not exist
+        """
+        if self._entities is None:
+            self._entities = {}
+        self._entities[(model_cls, id)] = _MISS if entity is None else entity
+
+    def forget_entity(self, model_cls, id):
+        """
+            Must be called after the entity is changed in the db
+        """
+        if self._entities is not None:
+            self._entities.pop((model_cls, id), None)
+
+    async def load_entity(self, model_cls, id, loader):
+        """
+            Returns the entity from the identity map or loads it with
+            `await loader(id)` (which returns a Model or None) and
+            remembers the result, so the entity is queried at most once
+            per request
+        """
+        entity = self.get_entity(model_cls, id)
+        if entity is not None:
+            return entity
+        entity = await loader(id)
+        self.put_entity(model_cls, id, entity)
+        if entity is None:
+            raise model_cls.DoesNotExist(id)
+        return entity
+
     @reify
     def log_prepend(self):
         """
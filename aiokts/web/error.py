@@ -36,6 +36,9 @@ class ServerError(Exception):
     BAD_REQUEST = Error('bad_request', 'Bad Request', http_code=400)
     FORBIDDEN = Error('forbidden', 'Forbidden', http_code=403)
     NOT_FOUND = Error('not_found', 'Not Found', http_code=404)
+    REQUEST_ENTITY_TOO_LARGE = Error('request_entity_too_large',
+                                     'Request Entity Too Large',
+                                     http_code=413)
     INTERNAL_ERROR = Error('internal_error', 'Internal Server Error',
                            http_code=500)
 
@@ -1,19 +1,86 @@
+import hashlib
 import weakref
 
 from aiohttp import hdrs
-from aiohttp.web import Response
+from aiohttp.web import Response, StreamResponse
 from multidict import CIMultiDict, CIMultiDictProxy
 
-from aiokts.util.json_utils import json_dumps
+from aiokts.util.json_utils import json_dumps_bytes
+from aiokts.util.msgpack_utils import _features as msgpack_features, \
+    msgpack_dumps
 
 __all__ = [
     'JsonResponse',
     'ApiResponse',
     'ApiOkResponse',
-    'ApiErrorResponse'
+    'ApiErrorResponse',
+    'StreamingApiOkResponse',
+    'make_etag',
+    'etag_matches',
 ]
 
 
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+MSGPACK_CONTENT_TYPES = (MSGPACK_CONTENT_TYPE, 'application/x-msgpack')
+
+
+def negotiate_content_type(accept):
+    """
+        MSGPACK_CONTENT_TYPE if Accept header lists msgpack with q not
+        lower than json (and msgpack is installed), else JSON_CONTENT_TYPE
+    """
+    if not accept or 'msgpack' not in accept \
+            or not msgpack_features['msgpack']:
+        return JSON_CONTENT_TYPE
+    msgpack_q = 0.0
+    json_q = 0.0
+    for part in accept.split(','):
+        media_type, _, params = part.partition(';')
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in MSGPACK_CONTENT_TYPES:
+            msgpack_q = max(msgpack_q, q)
+        elif media_type in (JSON_CONTENT_TYPE, 'application/*', '*/*'):
+            json_q = max(json_q, q)
+    if msgpack_q > 0 and msgpack_q >= json_q:
+        return MSGPACK_CONTENT_TYPE
+    return JSON_CONTENT_TYPE
+
+
+def make_etag(data):
+    """
+        Strong ETag (quoted) of bytes
+    """
+    return '"{}"'.format(hashlib.sha1(data).hexdigest())
+
+
+def etag_matches(if_none_match, etag):
+    """
+        Weak comparison of etag with If-None-Match header value
+    """
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
 class KtsResponse(Response):
     def __init__(self, *, body=None, status=200, reason=None, text=None,
                  headers=None, content_type=None, charset=None, ctx=None):
@@ -35,16 +102,37 @@ class JsonResponse(KtsResponse):
                  headers=None,
                  charset=None,
                  json_dump_func=None,
-                 ctx=None):
-        if json_dump_func is None:
-            json_dump_func = json_dumps
-
+                 ctx=None,
+                 etag=None,
+                 content_type=None):
+        """
+        :param etag: ETag header value or True to compute it from the body
+        :param content_type: JSON_CONTENT_TYPE (default) or
+                             MSGPACK_CONTENT_TYPE to pack the same body
+                             with msgpack (json_dump_func must not be set)
+        """
         body, status = self._process_body(body, status)
 
-        if charset is None:
-            charset = 'utf-8'
+        if content_type is None:
+            content_type = JSON_CONTENT_TYPE
 
-        body = json_dump_func(body).encode(charset)
+        if content_type in MSGPACK_CONTENT_TYPES:
+            if json_dump_func is not None:
+                raise ValueError(
+                    'json_dump_func is not supported for {}'.format(
+                        content_type))
+            charset = None
+            body = msgpack_dumps(body)
+        elif content_type == JSON_CONTENT_TYPE:
+            if charset is None:
+                charset = 'utf-8'
+            if json_dump_func is None:
+                body = json_dumps_bytes(body, charset)
+            else:
+                body = json_dump_func(body).encode(charset)
+        else:
+            raise ValueError(
+                'Unsupported content type {}'.format(content_type))
 
         if headers is None:
             headers = CIMultiDict()
@@ -54,13 +142,18 @@ class JsonResponse(KtsResponse):
         if hdrs.CONTENT_TYPE in headers:
             headers.pop(hdrs.CONTENT_TYPE)
 
+        if etag is True:
+            etag = make_etag(body)
+        if etag:
+            headers[hdrs.ETAG] = etag
+
         super().__init__(
             body=body,
             status=status,
             reason=reason,
             text=text,
             headers=headers,
-            content_type='application/json',
+            content_type=content_type,
             charset=charset,
             ctx=ctx
         )
@@ -76,7 +169,7 @@ class RawApiResponse(JsonResponse):
 class ApiResponse(RawApiResponse):
     def __init__(self, status='ok', data=None, http_status=200, *,
                  headers=None, charset=None, json_dump_func=None, ctx=None,
-                 **kwargs):
+                 etag=None, content_type=None, **kwargs):
         """
         :param status: "ok" or "error"
         :param data: data payload
@@ -109,7 +202,9 @@ class ApiResponse(RawApiResponse):
             headers=headers,
             charset=charset,
             json_dump_func=json_dump_func,
-            ctx=ctx
+            ctx=ctx,
+            etag=etag,
+            content_type=content_type
         )
 
     @staticmethod
@@ -127,12 +222,14 @@ class ApiResponse(RawApiResponse):
 class ApiOkResponse(ApiResponse):
     def __init__(self, data=None, http_status=200, *,
                  headers=None, charset=None, json_dump_func=None, ctx=None,
-                 **kwargs):
+                 etag=None, content_type=None, **kwargs):
         super(ApiOkResponse, self).__init__('ok', data, http_status,
                                             headers=headers,
                                             charset=charset,
                                             json_dump_func=json_dump_func,
                                             ctx=ctx,
+                                            etag=etag,
+                                            content_type=content_type,
                                             **kwargs)
 
     @staticmethod
@@ -144,7 +241,7 @@ class ApiOkResponse(ApiResponse):
 class ApiErrorResponse(ApiResponse):
     def __init__(self, message=None, data=None, http_status=500, *,
                  headers=None, charset=None, json_dump_func=None, ctx=None,
-                 **kwargs):
+                 etag=None, content_type=None, **kwargs):
         if message:
             kwargs['message'] = message
         super(ApiErrorResponse, self).__init__('error', data, http_status,
@@ -152,6 +249,8 @@ class ApiErrorResponse(ApiResponse):
                                                charset=charset,
                                                json_dump_func=json_dump_func,
                                                ctx=ctx,
+                                               etag=etag,
+                                               content_type=content_type,
                                                **kwargs)
 
     @staticmethod
@@ -161,3 +260,118 @@ class ApiErrorResponse(ApiResponse):
             extra['message'] = message
         return ApiResponse.generate_response_dict(api_status=api_status,
                                                   data=data, **extra)
+
+
+class StreamingApiOkResponse(StreamResponse):
+    """
+        ApiOkResponse with data being a list of items from an iterable
+        (sync or async, i.e. a generator over a streaming DB cursor).
+        Items are serialized one by one and written with chunked encoding
+        as the iterable yields them, so the whole listing is never held in
+        memory. Writes wait for the client (backpressure) when the
+        transport buffer is full.
+
+        Since the status is sent before the first item, an exception
+        raised by the iterable aborts the connection.
+
+        The body is written in prepare(), after the handler has returned,
+        so views finish the request Context (connections, trace) in
+        on_streamed callback
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, items, http_status=200, *,
+                 headers=None, charset=None, json_dump_func=None, ctx=None,
+                 chunk_size=None, **kwargs):
+        super().__init__(status=http_status, headers=headers)
+        self.content_type = 'application/json'
+        self.charset = charset or 'utf-8'
+        self.enable_chunked_encoding()
+
+        self._items = items
+        self._json_dump_func = json_dump_func
+        self._api_extra = kwargs
+        self._chunk_size = chunk_size or self.CHUNK_SIZE
+        self._streamed = False
+        self._ctx = weakref.ref(ctx) if ctx is not None else None
+        self._on_streamed = None
+        self._separator = b''
+
+    @property
+    def ctx(self):
+        return self._ctx() if self._ctx is not None else None
+
+    def _dumps(self, obj):
+        if self._json_dump_func is None:
+            return json_dumps_bytes(obj, self.charset)
+        return self._json_dump_func(obj).encode(self.charset)
+
+    def _envelope_start(self):
+        head = ApiResponse.generate_response_dict(api_status='ok',
+                                                  **self._api_extra)
+        head.pop('data')
+        # '{"status":"ok",...}' -> '{"status":"ok",...,"data":['
+        return self._dumps(head)[:-1] + ',"data":['.encode(self.charset)
+
+    @property
+    def streamed(self):
+        return self._streamed
+
+    def on_streamed(self, callback):
+        """
+            callback(response) is called once the body is written (or
+            writing failed). If the response is never prepared, i.e.
+            replaced by a middleware, callback(None) is called when it
+            is garbage collected
+        """
+        self._on_streamed = weakref.finalize(self, callback, None)
+
+    def _call_on_streamed(self):
+        if self._on_streamed is None:
+            return
+        info = self._on_streamed.detach()
+        self._on_streamed = None
+        if info is not None:
+            _, callback, _, _ = info
+            callback(self)
+
+    async def _write_item(self, buf, item):
+        buf += self._separator
+        buf += self._dumps(item)
+        self._separator = ','.encode(self.charset)
+        if len(buf) >= self._chunk_size:
+            await self.write(bytes(buf))
+            buf.clear()
+
+    async def prepare(self, request):
+        writer = await super().prepare(request)
+        if self._streamed:
+            return writer
+        self._streamed = True
+
+        try:
+            buf = bytearray(self._envelope_start())
+            items = self._items
+            # not `async for` in an async generator, python 3.5 has none
+            if hasattr(items, '__aiter__'):
+                iterator = items.__aiter__()
+                while True:
+                    try:
+                        item = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    await self._write_item(buf, item)
+            else:
+                for item in items:
+                    await self._write_item(buf, item)
+            buf += ']}'.encode(self.charset)
+            await self.write(bytes(buf))
+        except Exception as e:
+            ctx = self.ctx
+            if ctx is not None:
+                ctx.logger.exception('Streaming response aborted: %s', e)
+            raise
+        finally:
+            self._items = None
+            self._call_on_streamed()
+        return writer
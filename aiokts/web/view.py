@@ -1,24 +1,167 @@
 import asyncio
-import json
+import time
+import types
 
-from aiohttp import web
+from aiohttp import hdrs, web
+from multidict import CIMultiDict
 from aiohttp.web_exceptions import HTTPNotFound, HTTPException, \
     HTTPMethodNotAllowed
 from aiokts.web.context import Context
 from aiokts.web.error import ServerError
 
 from aiokts.util.arguments import ArgumentException
-from aiokts.web.response import ApiErrorResponse, ApiOkResponse
+from aiokts.util.json_utils import json_loads
+from aiokts.util.msgpack_utils import _features as msgpack_features, \
+    msgpack_loads
+from aiokts.web.response import JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPES, \
+    ApiErrorResponse, ApiOkResponse, KtsResponse, StreamingApiOkResponse, \
+    etag_matches, make_etag, negotiate_content_type
+
+
+_NOT_PARSED = object()
+
+
+def _http_methods(methods):
+    if isinstance(methods, str):
+        methods = (methods,)
+    return tuple(m.upper() for m in methods)
+
+
+def action(methods, name=None):
+    """
+        Registers ActionBaseView method as an action:
+
+        @action('GET')
+        async def home(self): ...
+
+        @action(['GET', 'POST'], 'user.get')
+        async def user_get(self): ...
+
+        - methods
+            HTTP метод или список методов
+
+        - name
+            Имя действия (match_info['method']), по умолчанию имя функции
+    """
+    methods = _http_methods(methods)
+
+    def _action(func):
+        actions = list(getattr(func, '_actions_', ()))
+        actions.append((methods, name or func.__name__))
+        func._actions_ = actions
+        return func
+
+    return _action
+
+
+def default_action(methods):
+    """
+        Registers ActionBaseView method called for unknown actions
+        of the given HTTP methods
+    """
+    methods = _http_methods(methods)
+
+    def _default_action(func):
+        func._default_action_ = methods
+        return func
+
+    return _default_action
+
+
+_NO_ACTIONS = {}
+
+
+class ActionTable(object):
+    """
+        Actions of an ActionBaseView class compiled from @action and
+        @default_action: {http method: {action: function}}, default
+        functions by http method and allowed http methods by action
+    """
+    __slots__ = ('actions', 'defaults', 'allowed', 'legacy')
+
+    def __init__(self, view_cls):
+        attrs = {}
+        for klass in reversed(view_cls.__mro__):
+            attrs.update(vars(klass))
+
+        self.actions = {}
+        self.defaults = {}
+        allowed = {}
+        for attr in attrs.values():
+            if not isinstance(attr, types.FunctionType):
+                continue
+            for methods, name in getattr(attr, '_actions_', ()):
+                for method in methods:
+                    self.actions.setdefault(method, {})[name] = attr
+                    allowed.setdefault(name, set()).add(method)
+            for method in getattr(attr, '_default_action_', ()):
+                self.defaults[method] = attr
+        self.allowed = {name: tuple(sorted(methods))
+                        for name, methods in allowed.items()}
+        # methods/default_methods are overridden
+        self.legacy = \
+            view_cls.methods is not ActionBaseView.methods \
+            or view_cls.default_methods is not ActionBaseView.default_methods
+        if self.legacy and (self.actions or self.defaults):
+            raise TypeError(
+                '{} overrides methods/default_methods, so its @action and '
+                '@default_action declarations would be ignored'.format(
+                    view_cls.__name__))
+
+    def get(self, method, action_title):
+        func = self.actions.get(method, _NO_ACTIONS).get(action_title)
+        if func is None:
+            func = self.defaults.get(method)
+        return func
 
 
 class BaseView(web.View):
     CONTEXT_CLS = Context
 
+    # parse request body on the first get_request_data() call instead of
+    # before the handler, so handlers not using it never read the body
+    LAZY_BODY = False
+
+    # max request body size in bytes, None - only client_max_size of
+    # the application
+    MAX_BODY_SIZE = None
+
+    # add ETag computed from the body to response_api_ok of GET requests
+    # and answer matching If-None-Match with 304
+    ETAG = False
+
+    # accept msgpack request bodies and answer api responses with
+    # msgpack if the client prefers it in Accept (if msgpack is installed).
+    # Responses then get Vary: Accept
+    MSGPACK = False
+
     def __init__(self, request):
         super().__init__(request)
         self.app = self.request.app
         self.ctx = self.request.ctx
-        self.request_data = None
+        self._request_data = _NOT_PARSED
+        self._version_etag = None
+        self._response_content_type = None
+
+    @property
+    def request_data(self):
+        """
+            Parsed query (GET) or body. With LAZY_BODY the body must be
+            parsed by `await self.get_request_data()` first
+        """
+        if self._request_data is _NOT_PARSED:
+            if self.request.method == 'GET':
+                self._request_data = self.request.url.query
+            elif self.LAZY_BODY:
+                raise RuntimeError('Request body is not parsed yet, use '
+                                   'await self.get_request_data()')
+            else:
+                return None
+        return self._request_data
+
+    @request_data.setter
+    def request_data(self, value):
+        self._request_data = value
 
     @property
     def logger(self):
@@ -37,54 +180,262 @@ class BaseView(web.View):
         return self.app.debug
 
     async def _iter(self):
+        self._start_trace()
+        res = None
         try:
             await self._parse_request()
             await self.pre_handle()
+            res = await self._check_etag_version()
+            if res is not None:
+                return res
             res = await super(BaseView, self)._iter()
             await self.post_handle(self.request, res)
+            res = self._conditional_response(res)
             return res
         except Exception as e:
             res = self.handle_exception(e)
             return res
+        finally:
+            self._finish_ctx(res)
+
+    def _start_trace(self):
+        tracer = getattr(self.app, 'tracer', None)
+        if tracer is None or self.ctx is None:
+            return
+        self.ctx.trace = tracer.start_trace(
+            '{} {}'.format(self.request.method, self.__class__.__name__),
+            **{
+                'ctx.hash': self.ctx.hash,
+                'http.method': self.request.method,
+                'http.target': self.request.path,
+            }
+        )
+
+    def _finish_ctx(self, response):
+        if self.ctx is None:
+            return
+        if isinstance(response, StreamingApiOkResponse) \
+                and not response.streamed:
+            # the body is written after the handler returns
+            response.on_streamed(self._finish_ctx)
+            return
+        self.ctx.release_conns()
+        if self.ctx.trace is not None:
+            if response is not None:
+                self.ctx.trace.set_attribute('http.status_code',
+                                             response.status)
+            self.ctx.trace.finish()
 
     async def _parse_request(self):
+        if not self.LAZY_BODY:
+            await self.get_request_data()
+
+    async def get_request_data(self):
+        """
+            Parses query (GET), json or urlencoded form body once
+            and returns it
+        """
+        if self._request_data is _NOT_PARSED:
+            self._request_data = await self._load_request_data()
+        return self._request_data
+
+    async def _load_request_data(self):
         if self.request.method == 'GET':
-            source = self.request.url.query
+            return self.request.url.query
+        if self.request.content_type.startswith('application/json'):
+            body = await self.read_body()
+            try:
+                # json.loads accepts bytes only since python 3.6
+                body = body.decode(self.request.charset or 'utf-8')
+                return self.load_json(body)
+            except ValueError:
+                raise ServerError(ServerError.BAD_REQUEST(
+                    message='Body must be a valid json'))
+        elif self.request.content_type.startswith(
+                'application/x-www-form-urlencoded'):
+            return await self.read_form()
+        elif self.accepts_msgpack_body():
+            body = await self.read_body()
+            try:
+                return self.load_msgpack(body)
+            except ValueError:
+                raise ServerError(ServerError.BAD_REQUEST(
+                    message='Body must be a valid msgpack'))
+        return None
+
+    def accepts_msgpack_body(self):
+        return self.MSGPACK and msgpack_features['msgpack'] \
+            and self.request.content_type in MSGPACK_CONTENT_TYPES
+
+    async def read_body(self):
+        """
+            Reads raw request body checking MAX_BODY_SIZE. The size is
+            checked while reading, so chunked bodies without
+            Content-Length are not read beyond the limit
+        """
+        request = self.request
+        self._check_body_size(request.content_length)
+        client_max_size = getattr(request, '_client_max_size', 0)
+        if self.MAX_BODY_SIZE is None or request._read_bytes is not None \
+                or 0 < client_max_size <= self.MAX_BODY_SIZE:
+            # aiohttp stops reading at client_max_size itself
+            return await request.read()
+
+        body = bytearray()
+        while True:
+            chunk = await request.content.readany()
+            if not chunk:
+                break
+            body.extend(chunk)
+            self._check_body_size(len(body))
+        # cached as by request.read(), so request.post() and
+        # request.json() use it
+        request._read_bytes = bytes(body)
+        return request._read_bytes
+
+    async def read_form(self):
+        """
+            request.post() checking MAX_BODY_SIZE. Multipart bodies are
+            parsed by aiohttp from the stream, so only their
+            Content-Length is checked
+        """
+        if self.request.content_type == 'application/x-www-form-urlencoded':
+            # request.post() parses the body read (and cached) here
+            await self.read_body()
         else:
-            if self.request.content_type.startswith('application/json'):
-                try:
-                    source = await self.request.json()
-                except json.JSONDecodeError:
-                    raise ServerError(ServerError.BAD_REQUEST(
-                        message='Body must be a valid json'))
-            elif self.request.content_type.startswith(
-                    'application/x-www-form-urlencoded'):
-                source = await self.request.post()
+            self._check_body_size(self.request.content_length)
+        return await self.request.post()
+
+    def _check_body_size(self, size):
+        if self.MAX_BODY_SIZE is not None and size is not None \
+                and size > self.MAX_BODY_SIZE:
+            raise ServerError(ServerError.REQUEST_ENTITY_TOO_LARGE(
+                message='Request body must not exceed {} bytes'.format(
+                    self.MAX_BODY_SIZE)))
+
+    def load_json(self, body):
+        """
+            Decodes json request body (str), override to use another
+            loader
+        """
+        return json_loads(body)
+
+    def load_msgpack(self, body):
+        return msgpack_loads(body)
+
+    def response_content_type(self, json_dump_func=None):
+        """
+            Content type of api responses negotiated from Accept header.
+            Responses with json_dump_func are always json
+        """
+        if json_dump_func is not None:
+            return JSON_CONTENT_TYPE
+        if self._response_content_type is None:
+            if self.MSGPACK:
+                self._response_content_type = negotiate_content_type(
+                    self.request.headers.get(hdrs.ACCEPT))
             else:
-                source = None
-        self.request_data = source
+                self._response_content_type = JSON_CONTENT_TYPE
+        return self._response_content_type
+
+    def _negotiated_headers(self, headers):
+        if not self.MSGPACK or not msgpack_features['msgpack']:
+            return headers
+        headers = CIMultiDict(headers or ())
+        headers.add(hdrs.VARY, hdrs.ACCEPT)
+        return headers
 
     async def pre_handle(self):
         pass
 
+    async def etag_version(self):
+        """
+            Override to return a version of the data the GET handler would
+            respond with (i.e. updated_at of an entity), or None.
+            The response ETag is then derived from the version, the
+            request path and the negotiated content type, and a matching
+            If-None-Match is answered with 304 without calling the
+            handler at all
+        """
+        return None
+
+    async def _check_etag_version(self):
+        if self.request.method not in (hdrs.METH_GET, hdrs.METH_HEAD):
+            return None
+        version = await self.etag_version()
+        if version is None:
+            return None
+        # json and msgpack representations must have different etags
+        self._version_etag = make_etag('{}\x00{}\x00{}'.format(
+            self.request.path_qs, self.response_content_type(),
+            version).encode('utf-8'))
+        if etag_matches(self.request.headers.get(hdrs.IF_NONE_MATCH),
+                        self._version_etag):
+            return self._not_modified_response(
+                self._version_etag, self._negotiated_headers(None))
+        return None
+
+    def _conditional_response(self, response):
+        if self.request.method not in (hdrs.METH_GET, hdrs.METH_HEAD) \
+                or not isinstance(response, web.Response) \
+                or response.status != 200:
+            return response
+        if self._version_etag is not None:
+            response.headers[hdrs.ETAG] = self._version_etag
+        etag = response.headers.get(hdrs.ETAG)
+        if etag_matches(self.request.headers.get(hdrs.IF_NONE_MATCH), etag):
+            return self._not_modified_response(etag, response.headers)
+        return response
+
+    def _not_modified_response(self, etag, headers=None):
+        res_headers = {hdrs.ETAG: etag}
+        if headers is not None:
+            for name in (hdrs.CACHE_CONTROL, hdrs.VARY, hdrs.EXPIRES):
+                if name in headers:
+                    res_headers[name] = headers[name]
+        return KtsResponse(status=304, headers=res_headers, ctx=self.ctx)
+
     async def post_handle(self, request, response):
         pass
 
     def response_api_ok(self, data=None, http_status=200, *,
                         headers=None, charset=None, json_dump_func=None,
-                        **kwargs):
+                        etag=None, **kwargs):
+        if etag is None and self.ETAG \
+                and self.request.method in (hdrs.METH_GET, hdrs.METH_HEAD):
+            etag = True
         return ApiOkResponse(ctx=self.ctx,
                              data=data, http_status=http_status,
-                             headers=headers, charset=charset,
-                             json_dump_func=json_dump_func, **kwargs)
+                             headers=self._negotiated_headers(headers),
+                             charset=charset,
+                             json_dump_func=json_dump_func, etag=etag,
+                             content_type=self.response_content_type(
+                                 json_dump_func),
+                             **kwargs)
+
+    def response_api_stream(self, items, http_status=200, *,
+                            headers=None, charset=None, json_dump_func=None,
+                            **kwargs):
+        """
+            Streams items (iterable or async iterable) as data list
+            of api ok response, see StreamingApiOkResponse
+        """
+        return StreamingApiOkResponse(items, http_status=http_status,
+                                      ctx=self.ctx, headers=headers,
+                                      charset=charset,
+                                      json_dump_func=json_dump_func,
+                                      **kwargs)
 
     def response_api_error(self, message=None, data=None, http_status=500, *,
                            headers=None, charset=None, json_dump_func=None,
                            **kwargs):
         return ApiErrorResponse(ctx=self.ctx,
                                 message=message, data=data,
-                                http_status=http_status, headers=headers,
+                                http_status=http_status,
+                                headers=self._negotiated_headers(headers),
                                 charset=charset, json_dump_func=json_dump_func,
+                                content_type=self.response_content_type(
+                                    json_dump_func),
                                 **kwargs)
 
     def handle_exception(self, e):
@@ -130,12 +481,35 @@ class BaseView(web.View):
             self.logger.error('{} is not an exception'.format(repr(e)))
 
 
-class ActionBaseView(BaseView):
+class ActionViewMetaclass(type(BaseView)):
+    def __init__(cls, class_name, bases, class_dict):
+        super().__init__(class_name, bases, class_dict)
+        if class_name != 'ActionBaseView':
+            # compiled at class creation, so invalid declarations
+            # fail on import
+            cls._action_table_ = ActionTable(cls)
+
+
+class ActionBaseView(BaseView, metaclass=ActionViewMetaclass):
+    """
+        Actions are registered with @action/@default_action decorators
+        (compiled once per class into ActionTable) or, the legacy way,
+        by overriding methods/default_methods properties which are then
+        evaluated on every request
+    """
     CONTEXT_CLS = Context
 
     def __init__(self, request):
         super().__init__(request)
 
+    @classmethod
+    def get_action_table(cls):
+        table = cls.__dict__.get('_action_table_')
+        if table is None:
+            table = ActionTable(cls)
+            cls._action_table_ = table
+        return table
+
     @property
     def store(self):
         return self.app.store
@@ -170,6 +544,21 @@ class ActionBaseView(BaseView):
         """
         return {}
 
+    def _get_legacy_action(self, method, action_title):
+        methods = self.methods or {}
+        executing_method = methods.get(method, {}).get(action_title)
+        if executing_method is None:
+            executing_method = self.default_methods.get(method)
+        return executing_method
+
+    def _get_allowed_methods(self, action_title):
+        table = self.get_action_table()
+        if table.legacy:
+            methods = self.methods or {}
+            return [k for k, k_actions in methods.items()
+                    if action_title in k_actions]
+        return table.allowed.get(action_title, ())
+
     async def before_action(self):
         pass
 
@@ -177,6 +566,8 @@ class ActionBaseView(BaseView):
         pass
 
     async def _iter(self):
+        self._start_trace()
+        result = None
         try:
             await self._parse_request()
             await self.pre_handle()
@@ -187,37 +578,53 @@ class ActionBaseView(BaseView):
                 raise HTTPNotFound()
 
             method = self.request.method.upper()
-            methods = self.methods
-            if methods is None:
-                methods = {}
-
-            actions = methods.get(method, {})
-
-            def_method = self.default_methods.get(method)
-            if action_title in actions:
-                executing_method = actions.get(action_title)
-            elif def_method is not None:
-                executing_method = def_method
+            table = self.get_action_table()
+            if table.legacy:
+                # bound methods from the methods property
+                executing_method = self._get_legacy_action(method,
+                                                           action_title)
             else:
-                executing_method = None
+                # functions, called with self
+                executing_method = table.get(method, action_title)
 
             if executing_method is not None:
+                cached_action = getattr(executing_method,
+                                        '_cached_action_', None)
+                cache_key = None
+                if cached_action is not None:
+                    result, cache_key = await cached_action.lookup(
+                        self, action_title, executing_method)
+                    if result is not None:
+                        await self.post_handle(self.request, result)
+                        result = self._conditional_response(result)
+                        return result
+                    started = time.perf_counter()
+
                 await self.before_action()
-                result = await executing_method()
+                result = await self._check_etag_version()
+                if result is not None:
+                    return result
+                if table.legacy:
+                    result = await executing_method()
+                else:
+                    result = await executing_method(self)
                 await self.after_action()
+                if cache_key is not None:
+                    await cached_action.store(
+                        self, cache_key, result,
+                        time.perf_counter() - started)
                 await self.post_handle(self.request, result)
+                result = self._conditional_response(result)
                 return result
             else:
-                allowed_methods = []
-                for k, k_actions in methods.items():
-                    if action_title in k_actions:
-                        allowed_methods.append(k)
-
+                allowed_methods = self._get_allowed_methods(action_title)
                 if allowed_methods:
                     raise HTTPMethodNotAllowed(method,
                                                allowed_methods=allowed_methods)
 
                 raise HTTPNotFound()
         except Exception as e:
-            res = self.handle_exception(e)
-            return res
+            result = self.handle_exception(e)
+            return result
+        finally:
+            self._finish_ctx(result)
@@ -0,0 +1,63 @@
+"""
+    Per-request overhead of Context: creation and log_request.
+
+    Usage:
+        python benchmarks/bench_context.py [number]
+"""
+import logging
+import sys
+import time
+
+from aiohttp.test_utils import make_mocked_request
+
+from aiokts.web.context import Context
+
+
+def bench(title, func, number, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - started) / number
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<40} {:>10.2f} us'.format(title, best * 1e6))
+    return best
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    request = make_mocked_request('GET', '/api/user.get?id=1')
+
+    def create():
+        Context(request)
+
+    def create_and_log():
+        Context(request).log_request()
+
+    def create_log_and_use():
+        ctx = Context(request)
+        ctx.log_request()
+        ctx.data.user_id = 1
+        ctx.logger.debug('user %s', 1)
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    bench('Context()', create, number)
+    bench('Context() + log_request (INFO off)', create_and_log, number)
+    bench('+ data + logger.debug (DEBUG off)', create_log_and_use, number)
+
+    # INFO on, but records dropped by the handler, so only the
+    # formatting and dispatch overhead is measured
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    root.handlers = [logging.NullHandler()]
+    root.setLevel(logging.INFO)
+    try:
+        bench('Context() + log_request (INFO on)', create_and_log, number)
+    finally:
+        root.handlers = handlers
+        root.setLevel(logging.WARNING)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+    JSON backend benchmarks on ApiOkResponse-like payloads.
+
+    Usage:
+        python benchmarks/bench_json.py [items]
+"""
+import datetime
+import enum
+import sys
+import time
+
+from aiokts.store.models import (BooleanField, DictField, IntEnumField,
+                                 IntField, Model, StringField,
+                                 UnixTimestampField)
+from aiokts.util import json_utils
+from aiokts.util.json_utils import json_dumps_bytes, json_loads
+
+
+class Status(enum.IntEnum):
+    new = 1
+    paid = 2
+
+
+class Order(Model):
+    id = IntField()
+    user_id = IntField()
+    title = StringField()
+    status = IntEnumField(Status)
+    paid = BooleanField(default=False)
+    created = UnixTimestampField()
+    meta = DictField()
+
+
+def make_payloads(n):
+    orders = [
+        Order(id=i, user_id=i % 100, title='Заказ #{}'.format(i),
+              status=1 + i % 2, paid=i % 2 == 1, created=1500000000 + i,
+              meta={'source': 'web', 'tags': ['a', 'b'], 'price': i * 1.5})
+        for i in range(n)
+    ]
+    return [
+        ('small dict', {'status': 'ok', 'data': {
+            'id': 1, 'name': 'user', 'balance': 10.5, 'active': True,
+            'updated': datetime.datetime(2020, 1, 1)}}, 10000),
+        ('{} models'.format(n), {'status': 'ok', 'data': {
+            'orders': orders, 'total': n}}, 10),
+        ('{} plain dicts'.format(n), {'status': 'ok', 'data': {
+            'orders': [o.__to_json__() for o in orders], 'total': n}}, 10),
+    ]
+
+
+def bench(title, func, number, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - started) / number
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<40} {:>10.1f} us'.format(title, best * 1e6))
+    return best
+
+
+def bench_models_list(n, backends):
+    orders = make_payloads(n)[1][1]['data']['orders']
+    print('{} models list'.format(n))
+    encoded = json_dumps_bytes(orders)
+    for backend in backends:
+        json_utils.set_json_backend(backend)
+        assert Model.dumps_json_list(orders) == encoded
+        generic = bench('{} json_dumps_bytes'.format(backend),
+                        lambda: json_dumps_bytes(orders), 3, repeat=10)
+        dumps_list = bench('{} Model.dumps_json_list'.format(backend),
+                           lambda: Model.dumps_json_list(orders), 3,
+                           repeat=10)
+        print('{} dumps_json_list speedup: {:.2f}x'.format(
+            backend, generic / dumps_list))
+    print()
+    json_utils.set_json_backend()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    backends = [name for name in ('json', 'ujson', 'orjson')
+                if name == 'json' or json_utils._features[name]]
+    for title, payload, number in make_payloads(n):
+        print(title)
+        encoded = json_dumps_bytes(payload)
+        results = {}
+        for backend in backends:
+            json_utils.set_json_backend(backend)
+            assert json_dumps_bytes(payload) == encoded
+            results[backend] = bench(
+                '{} dumps'.format(backend),
+                lambda: json_dumps_bytes(payload), number)
+            bench('{} loads'.format(backend),
+                  lambda: json_loads(encoded), number)
+        for backend in backends[1:]:
+            print('{} dumps speedup: {:.2f}x'.format(
+                backend, results['json'] / results[backend]))
+        print()
+    json_utils.set_json_backend()
+    bench_models_list(n, backends)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+    Model construction benchmarks.
+
+    Usage:
+        python benchmarks/bench_models.py [rows]
+"""
+import enum
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from aiokts.store.models import (BooleanField, DictField, Field, IntEnumField,
+                                 IntField, Model, StringField,
+                                 UnixTimestampField)
+from aiokts.util.json_utils import json_dumps
+from aiokts.util.msgpack_utils import _features as msgpack_features
+
+
+class Kind(enum.IntEnum):
+    regular = 1
+    premium = 2
+
+
+def make_model(name, **attrs):
+    fields = dict(
+        id=IntField(),
+        name=StringField(),
+        email=StringField(),
+        active=BooleanField(default=False),
+        kind=IntEnumField(Kind),
+        created=UnixTimestampField(),
+        balance=Field(default=0, private=False),
+        meta=DictField(),
+    )
+    fields.update(attrs)
+    return type(name, (Model,), fields)
+
+
+GenericUser = make_model('GenericUser', COMPILED=False)
+CompiledUser = make_model('CompiledUser')
+SlotsUser = make_model('SlotsUser', SLOTS=True)
+
+
+def make_rows(n):
+    return [
+        dict(id=i, name='user{}'.format(i), email='u{}@example.com'.format(i),
+             active=i % 2 == 0, kind=1 + i % 2, created=1500000000 + i,
+             balance=i * 10, meta={'i': i})
+        for i in range(n)
+    ]
+
+
+def bench(title, func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<40} {:>8.1f} ms'.format(title, best * 1000))
+    return best
+
+
+def bench_parse_list(rows):
+    print('parse_list, {} rows'.format(len(rows)))
+    generic = bench('generic __init__',
+                    lambda: GenericUser.parse_list(rows))
+    compiled = bench('compiled __init__',
+                     lambda: CompiledUser.parse_list(rows))
+    trusted = bench('trusted',
+                    lambda: CompiledUser.parse_list(rows, trusted=True))
+    print('speedup: {:.2f}x / {:.2f}x'.format(
+        generic / compiled, generic / trusted))
+
+
+def bench_from_rows(rows):
+    columns = tuple(rows[0].keys())
+    # DB drivers return positional rows
+    tuples = [tuple(d[c] for c in columns) for d in rows]
+    typed = ('id', 'name', 'email', 'active', 'balance')
+    print('row -> model, {} rows'.format(len(rows)))
+    generic = bench('dict + parse_list, generic __init__',
+                    lambda: GenericUser.parse_list(
+                        [dict(zip(columns, row)) for row in tuples]))
+    via_dict = bench('dict + parse_list, compiled __init__',
+                     lambda: CompiledUser.parse_list(
+                         [dict(zip(columns, row)) for row in tuples]))
+    from_rows = bench('from_rows',
+                      lambda: CompiledUser.from_rows(tuples, columns))
+    from_rows_raw = bench('from_rows, raw_columns',
+                          lambda: CompiledUser.from_rows(
+                              tuples, columns, raw_columns=typed))
+    print('speedup vs generic: {:.2f}x / {:.2f}x'.format(
+        generic / from_rows, generic / from_rows_raw))
+    print('speedup vs compiled: {:.2f}x / {:.2f}x'.format(
+        via_dict / from_rows, via_dict / from_rows_raw))
+
+
+def bench_to_json(rows):
+    print('models -> json bytes, {} rows'.format(len(rows)))
+    generic_models = GenericUser.parse_list(rows)
+    compiled_models = CompiledUser.parse_list(rows)
+    generic = bench('json_dumps, generic __to_json__',
+                    lambda: json_dumps(generic_models).encode('utf-8'))
+    compiled = bench('json_dumps, compiled __to_json__',
+                     lambda: json_dumps(compiled_models).encode('utf-8'))
+    dumps_list = bench('Model.dumps_json_list',
+                       lambda: Model.dumps_json_list(compiled_models))
+    print('speedup: {:.2f}x / {:.2f}x'.format(
+        generic / compiled, generic / dumps_list))
+
+
+def bench_binary(rows):
+    if not msgpack_features['msgpack']:
+        print('binary: msgpack is not installed, skipped')
+        return
+    print('model <-> cache bytes, {} rows'.format(len(rows)))
+    models = CompiledUser.parse_list(rows)
+    as_json = [json_dumps(m).encode('utf-8') for m in models]
+    as_binary = [m.dumps_binary() for m in models]
+    bench('json dumps', lambda: [json_dumps(m).encode('utf-8')
+                                 for m in models])
+    bench('dumps_binary', lambda: [m.dumps_binary() for m in models])
+    json_loads_time = bench('json loads + parse',
+                            lambda: [CompiledUser(**json.loads(b.decode()))
+                                     for b in as_json])
+    binary_loads_time = bench('loads_binary',
+                              lambda: [CompiledUser.loads_binary(b)
+                                       for b in as_binary])
+    json_size = sum(len(b) for b in as_json)
+    binary_size = sum(len(b) for b in as_binary)
+    print('loads speedup: {:.2f}x, size: {:.0f}%'.format(
+        json_loads_time / binary_loads_time,
+        100.0 * binary_size / json_size))
+
+
+def measure_memory(model_cls, rows):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    models = model_cls.parse_list(rows)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # both classes allocate the same field values, so the difference
+    # between them is the per-instance overhead
+    return (after - before) / len(models)
+
+
+def bench_memory(rows):
+    print('memory per instance, {} rows'.format(len(rows)))
+    with_dict = measure_memory(CompiledUser, rows)
+    with_slots = measure_memory(SlotsUser, rows)
+    print('{:<40} {:>8.1f} B'.format('__dict__', with_dict))
+    print('{:<40} {:>8.1f} B'.format('__slots__', with_slots))
+    print('saved: {:.0f}%'.format(100.0 * (1 - with_slots / with_dict)))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = make_rows(n)
+    bench_parse_list(rows)
+    print()
+    bench_from_rows(rows)
+    print()
+    bench_to_json(rows)
+    print()
+    bench_binary(rows)
+    print()
+    bench_memory(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import datetime
+import enum
+import json
+import math
+import time
+import unittest
+
+from aiokts.util import json_utils
+from aiokts.util.json_utils import (JsonSerializable, RawJson,
+                                    datetime_to_json, json_dumps,
+                                    json_dumps_bytes, json_loads)
+
+BACKENDS = [name for name in ('json', 'ujson', 'orjson')
+            if name == 'json' or json_utils._features[name]]
+
+
+class Kind(enum.IntEnum):
+    a = 1
+
+
+class Item(JsonSerializable):
+    def __init__(self, id):
+        self.id = id
+
+    def __to_json__(self):
+        return {'id': self.id, 'created': datetime.datetime(2020, 1, 1)}
+
+
+PAYLOAD = {
+    'status': 'ok',
+    'data': {
+        'items': [Item(1), Item(2)],
+        'title': 'Заказ "1" / \\ \n\u2028',
+        'price': 10.5,
+        'ratio': 0.1,
+        'zero': -0.0,
+        'count': 3,
+        'big': 2 ** 70,
+        'kind': Kind.a,
+        'flags': [True, False, None],
+        'int_keys': {1: 'a', 2.5: 'b', None: 'd'},
+        'bool_keys': {True: 'c'},
+        'raw': RawJson('{"cached":[1,2]}'),
+        'date': datetime.date(2020, 1, 2),
+        'empty': {},
+        'tuple': (1, 2),
+    },
+}
+
+
+class BackendsTestCase(unittest.TestCase):
+    def tearDown(self):
+        json_utils.set_json_backend()
+
+    def dumps_all(self, obj):
+        results = {}
+        for backend in BACKENDS:
+            json_utils.set_json_backend(backend)
+            try:
+                results[backend] = json_dumps_bytes(obj)
+            except (TypeError, ValueError, OverflowError) as e:
+                results[backend] = e.__class__
+        return results
+
+    def test_same_output(self):
+        expected = self.dumps_all(PAYLOAD)['json']
+        for backend, result in self.dumps_all(PAYLOAD).items():
+            with self.subTest(backend=backend):
+                self.assertEqual(result, expected)
+                self.assertEqual(json_dumps(PAYLOAD).encode('utf-8'),
+                                 result)
+
+    def test_exponent_floats_parse_equal(self):
+        values = [1e16, 1e-05, 1.5e300, 123456789.123]
+        for backend, result in self.dumps_all(values).items():
+            with self.subTest(backend=backend):
+                self.assertEqual(json_loads(result), values)
+
+    def loads_all(self, s):
+        results = {}
+        for backend in BACKENDS:
+            json_utils.set_json_backend(backend)
+            try:
+                results[backend] = json_loads(s)
+            except ValueError:
+                results[backend] = ValueError
+        return results
+
+    def test_loads_same_values(self):
+        docs = [
+            '[18446744073709551616, 18446744073709551615]',
+            '[-9223372036854775809, -9223372036854775808]',
+            '[123456789012345678901234567890]',
+            '{"id": "12345678901234567890123", "n": 1}',
+            '[1e400, -1e400, 1.5, 1e16, 5e-324]',
+            '"\\ud800"',
+            '{"a": 1, "a": 2}',
+        ]
+        for doc in docs:
+            for s in (doc, doc.encode('utf-8')):
+                for backend, result in self.loads_all(s).items():
+                    with self.subTest(backend=backend, doc=s):
+                        expected = json.loads(s)
+                        self.assertEqual(result, expected)
+                        self.assertEqual([type(v) for v in result],
+                                         [type(v) for v in expected])
+
+    def test_loads_nan(self):
+        for backend, result in self.loads_all('[NaN, Infinity]').items():
+            with self.subTest(backend=backend):
+                self.assertTrue(math.isnan(result[0]))
+                self.assertEqual(result[1], float('inf'))
+
+    def test_loads_invalid(self):
+        for doc in ('[1,]', '{"a"}', '', '[1] x'):
+            for backend, result in self.loads_all(doc).items():
+                with self.subTest(backend=backend, doc=doc):
+                    self.assertIs(result, ValueError)
+
+    def test_rejected_by_all(self):
+        for obj in ({1}, b'bytes', object()):
+            for backend, result in self.dumps_all(obj).items():
+                with self.subTest(backend=backend, obj=obj):
+                    self.assertIs(result, TypeError)
+
+
+class CachedBlock(JsonSerializable):
+    def __to_json__(self):
+        # the RawJson is referenced only by the returned dict
+        return {'raw': RawJson(b'[1,2]'), 'text': RawJson('{"a":null}')}
+
+
+class RawJsonTestCase(unittest.TestCase):
+    def tearDown(self):
+        json_utils.set_json_backend()
+
+    def test_created_in_to_json(self):
+        keep = RawJson('1')
+        obj = {'a': CachedBlock(), 'b': [CachedBlock()], 'keep': keep}
+        expected = (b'{"a":{"raw":[1,2],"text":{"a":null}},'
+                    b'"b":[{"raw":[1,2],"text":{"a":null}}],"keep":1}')
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                json_utils.set_json_backend(backend)
+                self.assertEqual(json_dumps_bytes(obj), expected)
+                self.assertEqual(json_dumps(obj), expected.decode('utf-8'))
+        self.assertEqual(json_dumps(obj, compact=False, sort_keys=True),
+                         '{"a": {"raw": [1,2], "text": {"a":null}}, '
+                         '"b": [{"raw": [1,2], "text": {"a":null}}], '
+                         '"keep": 1}')
+
+    def test_top_level(self):
+        self.assertEqual(json_dumps(RawJson('[1]')), '[1]')
+        self.assertEqual(json_dumps_bytes(RawJson('[1]')), b'[1]')
+
+
+class DatetimeToJsonTestCase(unittest.TestCase):
+    def test_same_as_mktime(self):
+        start = datetime.datetime(2000, 1, 1, 0, 0, 59, 123)
+        values = [start + datetime.timedelta(minutes=97 * i)
+                  for i in range(20000)]
+        values += [datetime.date(2010, 1, 1) + datetime.timedelta(days=i)
+                   for i in range(400)]
+        for value in values:
+            expected = int(time.mktime(value.timetuple()))
+            self.assertEqual(datetime_to_json(value), expected, value)
+
+    def test_aware_datetime(self):
+        value = datetime.datetime(2020, 1, 1, 12,
+                                  tzinfo=datetime.timezone.utc)
+        self.assertEqual(datetime_to_json(value),
+                         int(time.mktime(value.timetuple())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,311 @@
+import datetime
+import enum
+import time
+import unittest
+
+from aiokts.store.models import (DictField, ForeignModelField, IntEnumField,
+                                 IntField, Model, SchemaMismatchError,
+                                 StringField, UnixTimestampField)
+from aiokts.util import json_utils
+from aiokts.util.json_utils import json_dumps_bytes, json_loads
+
+
+class Status(enum.IntEnum):
+    new = 1
+    paid = 2
+
+
+class Inner(Model):
+    id = IntField()
+    title = StringField()
+
+
+class Compiled(Model):
+    id = IntField()
+    ts = UnixTimestampField()
+    inner = ForeignModelField(Inner)
+    status = IntEnumField(Status, default=Status.new)
+
+
+class NotCompiled(Model):
+    COMPILED = False
+
+    id = IntField()
+    ts = UnixTimestampField()
+    inner = ForeignModelField(Inner)
+    status = IntEnumField(Status, default=Status.new)
+
+
+class CustomInit(Model):
+    id = IntField()
+    ts = UnixTimestampField()
+    inner = ForeignModelField(Inner)
+    status = IntEnumField(Status, default=Status.new)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initialized = True
+
+
+class LazyNotCompiled(Model):
+    COMPILED = False
+
+    id = IntField()
+    meta = DictField(lazy=True)
+
+
+MODELS = (Compiled, NotCompiled, CustomInit)
+
+TS = datetime.datetime(2020, 1, 2, 3, 4, 5)
+
+
+class TrustedTestCase(unittest.TestCase):
+    def test_trusted_keeps_typed_values(self):
+        inner = Inner(id=1, title='x')
+        for model_cls in MODELS:
+            with self.subTest(model=model_cls.__name__):
+                m = model_cls.trusted(id=1, ts=TS, inner=inner,
+                                      status=Status.paid)
+                self.assertIs(m.__class__, model_cls)
+                self.assertEqual(m.id, 1)
+                self.assertEqual(m.ts, TS)
+                self.assertIs(m.inner, inner)
+                self.assertIs(m.status, Status.paid)
+
+    def test_trusted_runs_own_init(self):
+        m = CustomInit.trusted(id=1, ts=TS)
+        self.assertTrue(m.initialized)
+        self.assertEqual(m.ts, TS)
+        models = CustomInit.parse_list([{'id': 1}], trusted=True)
+        self.assertTrue(models[0].initialized)
+        self.assertTrue(CustomInit.parse({'id': 1}, trusted=True).initialized)
+
+    def test_trusted_defaults(self):
+        for model_cls in MODELS:
+            with self.subTest(model=model_cls.__name__):
+                m = model_cls.trusted(id=1)
+                self.assertIsNone(m.ts)
+                self.assertIsNone(m.inner)
+                self.assertIs(m.status, Status.new)
+
+    def test_parse_trusted(self):
+        for model_cls in MODELS:
+            with self.subTest(model=model_cls.__name__):
+                models = model_cls.parse_list([{'id': 1, 'ts': TS},
+                                               {'id': 2}], trusted=True)
+                self.assertEqual([m.id for m in models], [1, 2])
+                self.assertEqual(models[0].ts, TS)
+                m = model_cls.parse({'id': 3, 'ts': TS}, trusted=True)
+                self.assertEqual(m.ts, TS)
+
+    def test_trusted_lazy_field(self):
+        m = LazyNotCompiled.trusted(id=1, meta={'a': 1})
+        self.assertEqual(m.meta, {'a': 1})
+
+    def test_untrusted_still_transforms(self):
+        for model_cls in MODELS:
+            with self.subTest(model=model_cls.__name__):
+                m = model_cls(id='1', ts=1500000000,
+                              inner={'id': 2, 'title': 'y'}, status=2)
+                self.assertEqual(m.id, 1)
+                self.assertEqual(m.ts,
+                                 datetime.datetime.fromtimestamp(1500000000))
+                self.assertEqual(m.inner.id, 2)
+                self.assertIs(m.status, Status.paid)
+
+
+class BinaryTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        for model_cls in MODELS:
+            with self.subTest(model=model_cls.__name__):
+                m = model_cls.trusted(id=1, ts=TS,
+                                      inner=Inner(id=2, title='x'),
+                                      status=Status.paid)
+                loaded = model_cls.loads_binary(m.dumps_binary())
+                self.assertIs(loaded.__class__, model_cls)
+                self.assertEqual(loaded.id, 1)
+                self.assertEqual(loaded.ts, TS)
+                self.assertIs(loaded.inner.__class__, Inner)
+                self.assertEqual(loaded.inner.__to_json__(),
+                                 {'id': 2, 'title': 'x'})
+                self.assertIs(loaded.status, Status.paid)
+
+    def test_round_trip_runs_own_init(self):
+        m = CustomInit.trusted(id=1, ts=TS, inner=Inner(id=2, title='x'))
+        loaded = CustomInit.loads_binary(m.dumps_binary())
+        self.assertTrue(loaded.initialized)
+        self.assertEqual(loaded.ts, TS)
+        self.assertEqual(loaded.inner.id, 2)
+
+    def test_round_trip_none(self):
+        for model_cls in MODELS:
+            with self.subTest(model=model_cls.__name__):
+                m = model_cls.trusted(id=1)
+                loaded = model_cls.loads_binary(m.dumps_binary())
+                self.assertIsNone(loaded.ts)
+                self.assertIsNone(loaded.inner)
+
+    def test_schema_mismatch(self):
+        data = Compiled.trusted(id=1).dumps_binary()
+        with self.assertRaises(SchemaMismatchError):
+            NotCompiled.loads_binary(data)
+
+
+class JsonRow(Model):
+    id = IntField()
+    ts = UnixTimestampField()
+    inner = ForeignModelField(Compiled)
+    status = IntEnumField(Status, json_name=True)
+    secret = StringField(private=True)
+
+    def transform_json_id(self, v):
+        return v * 10
+
+
+class DumpsJsonListTestCase(unittest.TestCase):
+    def test_same_as_json_dumps(self):
+        inner = Compiled(id=2, ts=1500000000, inner={'id': 3, 'title': 'x'})
+        models = [
+            JsonRow.trusted(id=1, ts=TS, inner=inner, status=Status.paid,
+                            secret='s'),
+            JsonRow(id=2),
+            NotCompiled.trusted(id=3, ts=TS),
+            CustomInit(id=4, ts=1600000000),
+        ]
+        backends = [name for name in ('json', 'ujson', 'orjson')
+                    if name == 'json' or json_utils._features[name]]
+        try:
+            for backend in backends:
+                with self.subTest(backend=backend):
+                    json_utils.set_json_backend(backend)
+                    self.assertEqual(Model.dumps_json_list(models),
+                                     json_dumps_bytes(models))
+        finally:
+            json_utils.set_json_backend()
+
+    def test_empty(self):
+        self.assertEqual(Model.dumps_json_list([]), b'[]')
+
+
+class Tracked(Model):
+    TRACK_CHANGES = True
+
+    id = IntField()
+    ts = UnixTimestampField()
+    status = IntEnumField(Status)
+    meta = DictField()
+    title = StringField()
+
+
+class FakeColumn(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return self.name, other
+
+
+class FakeTable(object):
+    """
+        Records the calls of table.update().where().values()
+    """
+    def __init__(self, *columns):
+        self.c = {name: FakeColumn(name) for name in columns}
+        self.calls = []
+
+    def update(self):
+        self.calls.append(('update',))
+        return self
+
+    def where(self, clause):
+        self.calls.append(('where', clause))
+        return self
+
+    def values(self, **values):
+        self.calls.append(('values', values))
+        return self
+
+
+class FakeUpdateQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeTable('id', 'ts', 'status', 'meta', 'title')
+
+    def test_no_changes(self):
+        m = Tracked(id=1, ts=1500000000, status=1)
+        self.assertIsNone(m.build_update_query(self.table))
+        self.assertEqual(self.table.calls, [])
+
+    def test_query(self):
+        m = Tracked(id=1, ts=1500000000, status=1)
+        m.status = Status.paid
+        m.meta = {'a': 1}
+        self.assertIs(m.build_update_query(self.table), self.table)
+        self.assertEqual(self.table.calls, [
+            ('update',),
+            ('where', ('id', 1)),
+            ('values', {'status': 2, 'meta': '{"a":1}'}),
+        ])
+
+    def test_pk_changed(self):
+        m = Tracked(id=1, status=1)
+        m.id = 2
+        m.title = 'a'
+        with self.assertRaises(ValueError):
+            m.build_update_query(self.table)
+
+    def test_other_pk(self):
+        m = Tracked(id=1, title='a')
+        m.id = 2
+        m.status = Status.paid
+        m.build_update_query(self.table, pk='title')
+        self.assertIn(('where', ('title', 'a')), self.table.calls)
+
+
+class UpdateQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        try:
+            import sqlalchemy as sa
+        except ImportError:
+            self.skipTest('sqlalchemy is not installed')
+        self.table = sa.Table(
+            'tracked', sa.MetaData(),
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('ts', sa.Integer),
+            sa.Column('status', sa.Integer),
+            sa.Column('meta', sa.Text),
+            sa.Column('title', sa.String(100)))
+
+    def params(self, q):
+        return q.compile().params
+
+    def test_no_changes(self):
+        m = Tracked(id=1, ts=1500000000, status=1)
+        self.assertIsNone(m.build_update_query(self.table))
+
+    def test_db_values(self):
+        m = Tracked(id=1, ts=1500000000, status=1, meta={}, title='a')
+        m.ts = TS
+        m.status = Status.paid
+        m.meta = {'a': [1, 2]}
+        m.title = 'b'
+        params = self.params(m.build_update_query(self.table))
+        self.assertEqual(params['ts'], int(time.mktime(TS.timetuple())))
+        self.assertIs(type(params['status']), int)
+        self.assertEqual(params['status'], 2)
+        self.assertEqual(json_loads(params['meta']), {'a': [1, 2]})
+        self.assertEqual(params['title'], 'b')
+        self.assertEqual(params['id_1'], 1)
+
+    def test_only_changed(self):
+        m = Tracked(id=1, ts=1500000000, status=1)
+        m.status = 2
+        m.meta = None
+        params = self.params(m.build_update_query(self.table))
+        self.assertEqual(params['status'], 2)
+        self.assertIsNone(params['meta'])
+        self.assertNotIn('ts', params)
+        self.assertEqual(m.changes()['status'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()